@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import argparse
+import gc
+import pigpio
+import random
+import struct
+import time
+import ir
+
+
+def make_aeha_codes(data, repeat, unit=425):
+    codes = [(unit * 8, unit * 4)]
+    for d in data:
+        for _ in range(8):
+            if (d & 1) == 0:
+                codes.append((unit, unit))
+            else:
+                codes.append((unit, unit * 3))
+            d >>= 1
+    codes.append((unit, 8000))
+    for _ in range(repeat):
+        codes.append((unit * 8, unit * 8))
+        codes.append((unit, unit * 8))
+    return codes
+
+
+def make_aeha_data(length):
+    data = [0x23, 0xcb]
+    data.append(((data[0] ^ data[1]) >> 4) ^ ((data[0] ^ data[1]) & 0xf))
+    data.extend(i & 0xff for i in range(length - len(data)))
+    return data
+
+
+def make_reports(codes, frames, gpio, gap=20000):
+    report = struct.Struct('HHII')
+    bit = 1 << gpio
+    reports = bytearray()
+    seqno = 0
+    tick = 0
+    for _ in range(frames):
+        for high, low in codes:
+            reports += report.pack(seqno & 0xffff, 0, tick, 0)
+            tick += high
+            reports += report.pack((seqno + 1) & 0xffff, 0, tick, bit)
+            tick += low
+            seqno += 2
+        reports += report.pack(seqno & 0xffff, pigpio.NTFY_FLAGS_WDOG | gpio, tick, bit)
+        tick += gap
+        seqno += 1
+    return bytes(reports)
+
+
+def dispatch_per_report(buf, func, gpio):
+    # same per-report dispatch as the callback thread of pigpio
+    bit = 1 << gpio
+    last_level = bit
+    offset = 0
+    while len(buf) - offset >= 12:
+        msgbuf = buf[offset:offset + 12]
+        offset += 12
+        seq, flags, tick, level = struct.unpack('HHII', msgbuf)
+        if flags == 0:
+            changed = level ^ last_level
+            last_level = level
+            if bit & changed:
+                new_level = 0
+                if bit & level:
+                    new_level = 1
+                func(gpio, new_level, tick)
+        elif flags & pigpio.NTFY_FLAGS_WDOG:
+            if (flags & pigpio.NTFY_FLAGS_GPIO) == gpio:
+                func(gpio, pigpio.TIMEOUT, tick)
+
+
+class RecordedPi:
+    def set_watchdog(self, gpio, timeout):
+        pass
+
+    def read(self, gpio):
+        return 1
+
+
+def bench_capture(args):
+    gpio = 26
+    codes = make_aeha_codes(make_aeha_data(args.length), 0)
+    reports = make_reports(codes, args.frames, gpio)
+    print(f'{len(reports) // 12} reports, {args.frames} frames of {len(codes)} pairs')
+    for name in ('callback', 'notify'):
+        frames = []
+        receiver = ir.IrReceiver(RecordedPi(), gpio, frames.append, args.e, streaming=True)
+        start = time.perf_counter()
+        for _ in range(args.n):
+            if name == 'callback':
+                dispatch_per_report(reports, receiver._stream_edge_callback, gpio)
+            else:
+                receiver._notify_level = 1
+                receiver._feed_reports(reports, receiver._stream_edge_callback)
+        elapsed = time.perf_counter() - start
+        per_report = elapsed / args.n / (len(reports) // 12)
+        print(f'{name:>8}: {elapsed / args.n * 1e3:8.2f} msec/stream {per_report * 1e9:8.1f} nsec/report '
+              f'{len(frames)} frames')
+
+
+def bench_leader(args):
+    noise = [(random.randrange(50, 20000), random.randrange(50, 20000)) for _ in range(10000)]
+    print(f"{'protocols':>9} {'scan nsec/code':>15} {'index nsec/code':>16}")
+    for count in args.counts:
+        protocols = [ir.NEC, ir.AEHA, ir.SONY]
+        for i in range(count - len(protocols)):
+            protocols.append(ir.IrProtocol(f'P{i}', 300 + 7 * i, (10, 5), (1, 1), (1, 3), (1, 4)))
+        analyzers = [ir.IrCodeAnalyzer(protocol, args.e) for protocol in protocols[:count]]
+        leader_index = ir.receiver.IrLeaderIndex(analyzers)
+        start = time.perf_counter()
+        for code in noise:
+            for analyzer in analyzers:
+                if analyzer._is_leader(code):
+                    break
+        scan = (time.perf_counter() - start) / len(noise)
+        start = time.perf_counter()
+        for code in noise:
+            for analyzer in leader_index.lookup(code):
+                if analyzer._is_leader(code):
+                    break
+        index = (time.perf_counter() - start) / len(noise)
+        print(f'{count:>9} {scan * 1e9:>15.1f} {index * 1e9:>16.1f}')
+
+
+def make_nec_codes(data, repeat, unit=562):
+    codes = [(unit * 16, unit * 8)]
+    for d in data:
+        for _ in range(8):
+            if (d & 1) == 0:
+                codes.append((unit, unit))
+            else:
+                codes.append((unit, unit * 3))
+            d >>= 1
+    codes.append((unit, 40000))
+    for _ in range(repeat):
+        codes.append((unit * 16, unit * 4))
+        codes.append((unit, 96000))
+    return codes
+
+
+def bench_batch(args):
+    import numpy as np
+    import ir.batch
+    codes = []
+    for i in range(args.frames):
+        codes.extend(make_aeha_codes(make_aeha_data(args.length), args.repeat))
+        codes.extend(make_nec_codes([0x00, 0xff, i & 0xff, ~i & 0xff], args.repeat))
+    high = np.array([code[0] for code in codes])
+    low = np.array([code[1] for code in codes])
+    print(f'{len(codes)} pairs, {args.frames * 2} frames')
+    analyzers = [ir.IrCodeAnalyzerNec(args.e), ir.IrCodeAnalyzerAeha(args.e)]
+    start = time.perf_counter()
+    frames = 0
+    pos = 0
+    while pos < len(codes):
+        for analyzer in analyzers:
+            try:
+                if analyzer.analyze_at(codes, pos):
+                    frames += 1
+                    pos = analyzer.position
+                    break
+            except ir.IrError:
+                pos = analyzer.position
+                break
+        else:
+            pos += 1
+    elapsed = time.perf_counter() - start
+    print(f'analyzer: {elapsed * 1e3:8.1f} msec {elapsed / len(codes) * 1e9:6.1f} nsec/pair {frames} frames')
+    # the batch decoder takes the capture as arrays only, drop the pairs so that
+    # collecting millions of tuples is not charged to the frames it allocates
+    pairs = len(codes)
+    del codes
+    gc.collect()
+    start = time.perf_counter()
+    frames = ir.batch.decode_capture(high, low, args.e)
+    elapsed = time.perf_counter() - start
+    print(f'   batch: {elapsed * 1e3:8.1f} msec {elapsed / pairs * 1e9:6.1f} nsec/pair {len(frames)} frames')
+
+
+def bench_decode(args):
+    analyzer = ir.IrCodeAnalyzerAeha(args.e)
+    print(f"{'bytes':>6} {'pairs':>6} {'usec/frame':>12} {'nsec/pair':>10}")
+    for length in args.lengths:
+        codes = make_aeha_codes(make_aeha_data(length), args.repeat)
+        start = time.perf_counter()
+        for _ in range(args.n):
+            analyzer.analyze_at(codes, 0)
+        elapsed = time.perf_counter() - start
+        per_frame = elapsed / args.n
+        print(f'{length:>6} {len(codes):>6} {per_frame * 1e6:>12.1f} {per_frame / len(codes) * 1e9:>10.1f}')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        '-n', type=int, default=200, help='Number of iterations')
+    arg_parser.add_argument(
+        '-e', type=float, default=0.5, help='Error rate for receiver')
+    sub_parsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    decode_parser = sub_parsers.add_parser(
+        'decode', help='IR frame decode time against frame length')
+    decode_parser.add_argument(
+        '--repeat', type=int, default=10, help='Number of repeat codes')
+    decode_parser.add_argument(
+        'lengths', type=int, nargs='*', default=[4, 8, 16, 32, 64, 128, 256],
+        help='Frame lengths in bytes')
+    decode_parser.set_defaults(func=bench_decode)
+
+    capture_parser = sub_parsers.add_parser(
+        'capture', help='Edge capture by pigpio callback against notification pipe')
+    capture_parser.add_argument(
+        '--frames', type=int, default=100, help='Number of frames in recorded stream')
+    capture_parser.add_argument(
+        '--length', type=int, default=16, help='Frame length in bytes')
+    capture_parser.set_defaults(func=bench_capture)
+
+    batch_parser = sub_parsers.add_parser(
+        'batch', help='Offline decode of a recorded capture by analyzers against numpy')
+    batch_parser.add_argument(
+        '--frames', type=int, default=10000, help='Number of frames of each protocol')
+    batch_parser.add_argument(
+        '--length', type=int, default=16, help='AEHA frame length in bytes')
+    batch_parser.add_argument(
+        '--repeat', type=int, default=2, help='Number of repeat codes')
+    batch_parser.set_defaults(func=bench_batch)
+
+    leader_parser = sub_parsers.add_parser(
+        'leader', help='Rejection of noise codes against number of protocols')
+    leader_parser.add_argument(
+        'counts', type=int, nargs='*', default=[1, 2, 3, 8, 16, 32],
+        help='Numbers of registered protocols')
+    leader_parser.set_defaults(func=bench_leader)
+
+    args = arg_parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
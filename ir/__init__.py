@@ -1,13 +1,26 @@
 from .error import IrError
-from .receiver import IrReceiver, IrCodeAnalyzerNec, IrCodeAnalyzerAeha
-from .transmitter import IrTransmitter, IrCodeGeneratorNec, IrCodeGeneratorAeha
+from .protocol import IrProtocol, NEC, AEHA, SONY, PROTOCOLS
+from .frame import IrFrame, IrEvent
+from .library import IrLibrary
+from .receiver import IrReceiver, IrCodeAnalyzer, IrCodeAnalyzerNec, IrCodeAnalyzerAeha
+from .transmitter import IrTransmitter, IrCodeGenerator, IrCodeGeneratorNec, IrCodeGeneratorAeha
 
 __all__ = [
     'IrError',
+    'IrProtocol',
+    'NEC',
+    'AEHA',
+    'SONY',
+    'PROTOCOLS',
+    'IrFrame',
+    'IrEvent',
     'IrReceiver',
+    'IrCodeAnalyzer',
     'IrCodeAnalyzerNec',
     'IrCodeAnalyzerAeha',
     'IrTransmitter',
+    'IrCodeGenerator',
     'IrCodeGeneratorNec',
     'IrCodeGeneratorAeha',
+    'IrLibrary',
 ]
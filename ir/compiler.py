@@ -0,0 +1,112 @@
+import pigpio
+
+
+class IrPulseCompiler:
+    CHAIN_MAX = 600  # entries of a wave chain supported by pigpio
+    LOOP_MAX = 20  # loop counters of a wave chain supported by pigpio
+    _DELAY_MAX = 65535
+
+    def __init__(self, pi, gpio, duty_cycle, max_wave_cycles):
+        self._pi = pi
+        self._gpio_bit = 1 << gpio
+        self._duty_cycle = duty_cycle
+        self._max_wave_cycles = max_wave_cycles  # longer marks are looped carrier waves
+        self._carriers = {}  # carrier wave id per frequency
+        self._waves = {}  # pulses of each created wave id
+        self.wave_pulses = 0  # pulses used by created waves
+
+    def clear(self):
+        for wave_id in self._waves:
+            self._pi.wave_delete(wave_id)
+        self._waves.clear()
+        self._carriers.clear()
+        self.wave_pulses = 0
+
+    def release_symbol(self, fragment):
+        # deletes the wave of a symbol from compile_symbol, looped carrier waves are shared and kept
+        if len(fragment) == 1:
+            wave_id = fragment[0]
+            self._pi.wave_delete(wave_id)
+            self.wave_pulses -= self._waves.pop(wave_id)
+
+    def compile(self, protocol, frequency=None):
+        if frequency is None:
+            frequency = protocol.frequency
+        unit = protocol.unit
+        unit_cycles = self._unit_cycles(protocol, frequency)
+        fragments = []
+        durations = []
+        for symbol in protocol.symbols:
+            if symbol is None:
+                fragments.append(None)
+                durations.append(0)
+                continue
+            mark, space = symbol
+            fragment, duration = self.compile_symbol(frequency, mark * unit_cycles, space * unit)
+            fragments.append(fragment)
+            durations.append(duration)
+        return fragments, durations
+
+    def symbol_loops(self, protocol, frequency=None):
+        # loop counters used by each compiled symbol, known without creating waves
+        if frequency is None:
+            frequency = protocol.frequency
+        unit_cycles = self._unit_cycles(protocol, frequency)
+        return [0 if symbol is None or not self.is_looped(symbol[0] * unit_cycles) else 1
+                for symbol in protocol.symbols]
+
+    def is_looped(self, cycles):
+        # longer marks are looped carrier waves
+        return cycles > self._max_wave_cycles
+
+    @staticmethod
+    def _unit_cycles(protocol, frequency):
+        return round(protocol.unit * frequency / 1000000)
+
+    def compile_symbol(self, frequency, cycles, space):
+        period, high = self._carrier_timing(frequency)
+        low = period - high
+        duration = cycles * period + space
+        if not self.is_looped(cycles):
+            gpio_bit = self._gpio_bit
+            pulses = []
+            for _ in range(cycles - 1):
+                pulses.append(pigpio.pulse(gpio_bit, 0, high))
+                pulses.append(pigpio.pulse(0, gpio_bit, low))
+            pulses.append(pigpio.pulse(gpio_bit, 0, high))
+            pulses.append(pigpio.pulse(0, gpio_bit, low + space))
+            return [self._create_wave(pulses)], duration
+        fragment = [255, 0, self._carrier(frequency), 255, 1, cycles & 0xff, cycles >> 8]
+        fragment.extend(self.delay(space))
+        return fragment, duration
+
+    def delay(self, duration):
+        fragment = []
+        while duration > 0:
+            step = min(duration, self._DELAY_MAX)
+            fragment.extend((255, 2, step & 0xff, step >> 8))
+            duration -= step
+        return fragment
+
+    def _carrier_timing(self, frequency):
+        period = round(1000000 / frequency)
+        high = round(period * self._duty_cycle)
+        return period, high
+
+    def _carrier(self, frequency):
+        wave_id = self._carriers.get(frequency)
+        if wave_id is None:
+            period, high = self._carrier_timing(frequency)
+            wave_id = self._create_wave([
+                pigpio.pulse(self._gpio_bit, 0, high),
+                pigpio.pulse(0, self._gpio_bit, period - high),
+            ])
+            self._carriers[frequency] = wave_id
+        return wave_id
+
+    def _create_wave(self, pulses):
+        self._pi.wave_add_generic(pulses)
+        wave_id = self._pi.wave_create()
+        self._waves[wave_id] = len(pulses)
+        self.wave_pulses += len(pulses)
+        return wave_id
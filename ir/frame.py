@@ -0,0 +1,91 @@
+import collections
+
+
+class IrFrame(collections.namedtuple('IrFrame', ['protocol', 'data', 'repeat', 'tick'])):
+    # decoded frame, tick is the tick at the start of the leader
+    __slots__ = ()
+
+    def __str__(self):
+        data = ', '.join(hex(d) for d in self.data)
+        if self.repeat:
+            return f'{self.protocol.name}: [{data}] (repeat {self.repeat})'
+        return f'{self.protocol.name}: [{data}]'
+
+
+class IrEvent(collections.namedtuple('IrEvent', ['kind', 'frame', 'count', 'start_tick', 'tick'])):
+    # button event, count is the number of repeats since the press
+    __slots__ = ()
+
+    PRESS = 'press'
+    HOLD = 'hold'
+    RELEASE = 'release'
+
+    def __str__(self):
+        frame = self.frame._replace(repeat=0)
+        if self.kind == self.PRESS:
+            return f'Press {frame}'
+        duration = ((self.tick - self.start_tick) & 0xffffffff) // 1000
+        return f'{self.kind.capitalize()} {frame} ({self.count} repeats, {duration} msec)'
+
+
+class IrEventCoalescer:
+    def __init__(self, handler, hold_interval, release_interval):
+        self._handler = handler  # event handler
+        self._hold_interval = int(hold_interval * 1000000)  # minimum ticks between hold events
+        self._release_interval = int(release_interval * 1000000)  # maximum ticks between repeats
+        self._frame = None  # frame of the held button
+        self._repeat = 0  # repeat count of the last frame
+        self._count = 0  # repeats since the press
+        self._start_tick = 0
+        self._last_tick = 0
+        self._hold_tick = None  # tick of the last hold event
+
+    @property
+    def is_held(self):
+        return self._frame is not None
+
+    def __call__(self, result):
+        if not isinstance(result, IrFrame):
+            self._handler(result)
+            return
+        frame = result
+        held = self._frame
+        # tick of the last repeat code, or of the frame if it has no repeat code
+        tick = (frame.tick + frame.repeat * frame.protocol.period) & 0xffffffff
+        is_repeat = held is not None and frame.tick == held.tick and frame.repeat > self._repeat
+        first_tick = tick if is_repeat else frame.tick
+        if (held is None or held.protocol is not frame.protocol or held.data != frame.data
+                or ((first_tick - self._last_tick) & 0xffffffff) > self._release_interval):
+            if held is not None:
+                self.release(self._last_tick)
+            self._frame = frame
+            self._repeat = frame.repeat
+            self._count = frame.repeat
+            self._start_tick = frame.tick
+            self._last_tick = tick
+            self._hold_tick = None
+            self._handler(IrEvent(IrEvent.PRESS, frame, 0, frame.tick, frame.tick))
+            if self._count:
+                self._hold(tick)
+            return
+        if is_repeat:
+            self._count += frame.repeat - self._repeat
+        else:
+            # same frame is sent again
+            self._count += 1 + frame.repeat
+        self._repeat = frame.repeat
+        self._last_tick = tick
+        self._hold(tick)
+
+    def _hold(self, tick):
+        if self._hold_tick is not None and ((tick - self._hold_tick) & 0xffffffff) < self._hold_interval:
+            return
+        self._hold_tick = tick
+        self._handler(IrEvent(IrEvent.HOLD, self._frame, self._count, self._start_tick, tick))
+
+    def release(self, tick):
+        frame = self._frame
+        if frame is None:
+            return
+        self._frame = None
+        self._handler(IrEvent(IrEvent.RELEASE, frame, self._count, self._start_tick, tick))
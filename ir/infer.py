@@ -0,0 +1,151 @@
+import numpy as np
+from .error import IrError
+from .protocol import IrProtocol
+
+_UNITS_MAX = 12  # longest mark or space of a frame in units of the shortest one
+_GAP_RATE = 2  # spaces longer than this times the longest frame space split frames
+
+
+def cluster(durations, tolerance=0.2, iterations=8):
+    # 1-D k-means seeded by splitting sorted durations at relative gaps wider than tolerance,
+    # returns centers in ascending order, counts and labels of durations
+    durations = np.asarray(durations, dtype=np.float64)
+    if len(durations) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    values = np.sort(durations)
+    cuts = np.concatenate([[0], np.flatnonzero(values[1:] > values[:-1] * (1 + tolerance)) + 1])
+    centers = np.add.reduceat(values, cuts) / np.diff(np.append(cuts, len(values)))
+    for _ in range(iterations):
+        labels = np.searchsorted((centers[1:] + centers[:-1]) / 2, durations)
+        counts = np.bincount(labels, minlength=len(centers))
+        used = counts > 0
+        new_centers = np.bincount(labels, weights=durations, minlength=len(centers))[used] / counts[used]
+        if len(new_centers) == len(centers) and np.allclose(new_centers, centers):
+            break
+        centers = new_centers
+    labels = np.searchsorted((centers[1:] + centers[:-1]) / 2, durations)
+    counts = np.bincount(labels, minlength=len(centers))
+    return centers, counts, labels
+
+
+def _unit(centers, counts):
+    # weighted estimate of the time all frequent centers are multiples of
+    multiples = np.maximum(np.round(centers / centers[0]), 1)
+    used = multiples <= _UNITS_MAX * 2
+    return (centers[used] * counts[used]).sum() / (multiples[used] * counts[used]).sum()
+
+
+def _most_common(pairs):
+    keys, counts = np.unique(pairs, axis=0, return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    return [tuple(int(v) for v in keys[i]) for i in order], counts[order]
+
+
+def infer_protocol(captures, name='LEARNED', frequency=38000, min_share=0.01):
+    # captures are lists of (high, low) such as raw codes of IrReceiver
+    pairs = [np.asarray(codes, dtype=np.float64).reshape(-1, 2) for codes in captures if len(codes)]
+    if not pairs:
+        raise IrError('No captured codes')
+    capture_ends = np.cumsum([len(p) for p in pairs])
+    codes = np.concatenate(pairs)
+    highs = codes[:, 0]
+    lows = codes[:, 1]
+    last = np.zeros(len(codes), dtype=bool)
+    last[capture_ends - 1] = True
+
+    # unit time from clusters of marks and spaces inside frames
+    space_centers, space_counts, _ = cluster(lows[~last])
+    frequent = space_counts >= max(1, min_share * space_counts.sum())
+    space_centers, space_counts = space_centers[frequent], space_counts[frequent]
+    mark_centers, mark_counts, _ = cluster(highs)
+    frequent = mark_counts >= max(1, min_share * mark_counts.sum())
+    mark_centers, mark_counts = mark_centers[frequent], mark_counts[frequent]
+    if len(mark_centers) == 0:
+        raise IrError('No frequent marks')
+    shortest = mark_centers[0] if len(space_centers) == 0 else min(mark_centers[0], space_centers[0])
+    in_frame = space_centers <= shortest * _UNITS_MAX
+    gap_min = _GAP_RATE * (space_centers[in_frame].max() if in_frame.any() else shortest)
+    centers = np.concatenate([mark_centers, space_centers[in_frame]])
+    counts = np.concatenate([mark_counts, space_counts[in_frame]])
+    order = np.argsort(centers)
+    unit = _unit(centers[order], counts[order])
+
+    # split captures into frames at long spaces
+    ends = last | (lows > gap_min)
+    starts = np.concatenate([[0], np.flatnonzero(ends)[:-1] + 1])
+    lengths = np.flatnonzero(ends) - starts + 1
+    units = np.maximum(np.round(codes / unit), 1).astype(np.int64)
+    units[ends, 1] = 0  # open space
+
+    # leader is the most common first code of long frames, short frames are repeat codes
+    long_frames = lengths > 3
+    if not long_frames.any():
+        raise IrError('No data frames')
+    leader = _most_common(units[starts[long_frames]])[0][0]
+    data_frames = long_frames & np.all(units[starts] == leader, axis=1)
+    repeat = None
+    repeat_trailer = None
+    short_frames = (lengths == 2) & ~np.all(units[starts] == leader, axis=1)
+    if short_frames.sum() >= min_share * len(starts) and short_frames.any():
+        repeat = _most_common(units[starts[short_frames]])[0][0]
+        repeat_trailer = (_most_common(units[starts[short_frames] + 1])[0][0][0], 1)
+
+    # two most common codes of data frames are bits, the shorter one is zero
+    frame_index = np.repeat(np.arange(len(starts)), lengths)
+    in_data = data_frames[frame_index] & ~ends
+    in_data[starts[data_frames]] = False
+    symbols, _ = _most_common(units[in_data])
+    if len(symbols) < 2:
+        raise IrError('No bit encoding')
+    zero, one = sorted(symbols[:2], key=lambda symbol: (sum(symbol), symbol))
+
+    # pulse width codes end with the mark of the last bit, pulse distance codes with a trailer
+    trailer = None
+    end_space = None
+    bit_counts = lengths[data_frames] - 1
+    if zero[0] == one[0]:
+        trailer_mark = _most_common(units[starts[data_frames] + lengths[data_frames] - 1])[0][0][0]
+        trailer = (trailer_mark, max(zero[1], one[1]) + 1)
+        bit_counts -= 1
+    bit_count_values, bit_count_counts = np.unique(bit_counts, return_counts=True)
+    if len(bit_count_values) == 1 or trailer is None:
+        bits = int(bit_count_values[np.argmax(bit_count_counts)])
+    elif np.all(bit_count_values % 8 == 0):
+        bits = None  # byte aligned variable length
+        end_space = int(gap_min)
+    else:
+        bits = int(bit_count_values[np.argmax(bit_count_counts)])
+
+    # interval of frames following each other in a capture
+    period = 0
+    capture_of_frame = np.searchsorted(capture_ends, starts, side='right')
+    following = np.flatnonzero(capture_of_frame[1:] == capture_of_frame[:-1])
+    if len(following):
+        frame_ticks = np.concatenate([[0], np.cumsum(codes.sum(axis=1))])[starts]
+        period = int(np.median(frame_ticks[following + 1] - frame_ticks[following]))
+
+    return IrProtocol(
+        name, int(round(unit)),
+        leader=leader,
+        zero=zero,
+        one=one,
+        trailer=trailer,
+        end_space=end_space,
+        repeat=repeat,
+        repeat_trailer=repeat_trailer,
+        bits=bits,
+        frequency=frequency,
+        period=period)
+
+
+def format_protocol(protocol):
+    # source of a protocol spec in the form of ir.protocol
+    lines = [f"{protocol.name} = IrProtocol(", f"    '{protocol.name}', {protocol.unit},"]
+    for key in ('leader', 'zero', 'one', 'trailer', 'end_space', 'repeat', 'repeat_trailer', 'bits'):
+        value = getattr(protocol, key)
+        if value is not None:
+            lines.append(f'    {key}={value},')
+    if protocol.frequency != 38000:
+        lines.append(f'    frequency={protocol.frequency},')
+    lines.append(f'    period={protocol.period})')
+    return '\n'.join(lines)
@@ -0,0 +1,173 @@
+import mmap
+import os
+import struct
+from .error import IrError
+
+
+def _write_varint(buf, value):
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(buf, pos):
+    value = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _encode_codes(codes):
+    # zigzag encoded difference from the previous mark or space
+    buf = bytearray()
+    last_high = 0
+    last_low = 0
+    for high, low in codes:
+        delta = high - last_high
+        _write_varint(buf, (delta << 1) ^ (delta >> 63))
+        delta = low - last_low
+        _write_varint(buf, (delta << 1) ^ (delta >> 63))
+        last_high = high
+        last_low = low
+    return bytes(buf)
+
+
+def _decode_codes(buf, pos, count):
+    codes = []
+    high = 0
+    low = 0
+    for _ in range(count):
+        value, pos = _read_varint(buf, pos)
+        high += (value >> 1) ^ -(value & 1)
+        value, pos = _read_varint(buf, pos)
+        low += (value >> 1) ^ -(value & 1)
+        codes.append((high, low))
+    return codes
+
+
+class IrLibrary:
+    _MAGIC = b'IRLB'
+    _VERSION = 1
+    _HEADER = struct.Struct('<4sBxxxII')  # magic, version, index offset, number of commands
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._map = None  # mapped library file
+        self._index = {}  # name: (frequency, offset, count, size) in mapped file
+        self._learned = {}  # name: (frequency, codes) not saved yet
+        self._removed = set()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self._learned or (name in self._index and name not in self._removed)
+
+    def __len__(self):
+        return len(self.names())
+
+    def names(self):
+        names = [name for name in self._index if name not in self._removed and name not in self._learned]
+        names.extend(self._learned)
+        return names
+
+    def open(self):
+        if self._map is not None:
+            raise RuntimeError('IrLibrary already opened')
+        if not os.path.exists(self._path) or os.path.getsize(self._path) == 0:
+            return
+        self._file = open(self._path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_offset, count = self._HEADER.unpack_from(self._map, 0)
+        if magic != self._MAGIC or version != self._VERSION:
+            self.close()
+            raise IrError(f'Not an IR library: {self._path}')
+        pos = index_offset
+        for _ in range(count):
+            length, pos = _read_varint(self._map, pos)
+            name = self._map[pos:pos + length].decode()
+            pos += length
+            entry = []
+            for _ in range(4):
+                value, pos = _read_varint(self._map, pos)
+                entry.append(value)
+            self._index[name] = tuple(entry)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._index.clear()
+
+    def get(self, name):
+        learned = self._learned.get(name)
+        if learned is not None:
+            frequency, codes = learned
+            return list(codes), frequency
+        if name in self._removed or name not in self._index:
+            raise KeyError(name)
+        frequency, offset, count, _ = self._index[name]
+        return _decode_codes(self._map, offset, count), frequency
+
+    def learn(self, name, codes, frequency=38000):
+        self._learned[name] = (frequency, list(codes))
+        self._removed.discard(name)
+
+    def remove(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self._learned.pop(name, None)
+        self._removed.add(name)
+
+    def save(self):
+        data = bytearray(self._HEADER.size)
+        index = bytearray()
+        offsets = {}  # identical codes are stored once
+        count = 0
+        for name in self.names():
+            learned = self._learned.get(name)
+            if learned is None:
+                # saved commands are copied without decoding
+                frequency, offset, codes_count, size = self._index[name]
+                encoded = self._map[offset:offset + size]
+            else:
+                frequency, codes = learned
+                codes_count = len(codes)
+                encoded = _encode_codes(codes)
+            encoded_name = name.encode()
+            _write_varint(index, len(encoded_name))
+            index += encoded_name
+            offset = offsets.get(encoded)
+            if offset is None:
+                offset = len(data)
+                offsets[encoded] = offset
+                data += encoded
+            for value in (frequency, offset, codes_count, len(encoded)):
+                _write_varint(index, value)
+            count += 1
+        self._HEADER.pack_into(data, 0, self._MAGIC, self._VERSION, len(data), count)
+        data += index
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path)
+        self.close()
+        self._learned.clear()
+        self._removed.clear()
+        self.open()
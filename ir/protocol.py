@@ -0,0 +1,84 @@
+from .error import IrError
+
+
+class IrProtocol:
+    def __init__(self, name, unit, leader, zero, one, trailer=None, end_space=None, repeat=None,
+                 repeat_trailer=None, bits=None, frequency=38000, period=0, check=None, complete=None):
+        self.name = name
+        self.unit = unit  # unit time in microseconds
+        self.leader = leader  # (mark, space) in units
+        self.zero = zero
+        self.one = one
+        self.trailer = trailer  # stop bit, or None if the last bit ends the frame
+        self.end_space = end_space  # shortest trailer space in microseconds, default is trailer space
+        self.repeat = repeat  # leader of repeat code, or None if frames are resent
+        self.repeat_trailer = repeat_trailer
+        self.bits = bits  # number of data bits, or None for byte aligned variable length
+        self.frequency = frequency  # carrier frequency
+        self.period = period  # interval of frames and repeat codes in microseconds
+        self.check = check  # raises IrError for broken data
+        self.complete = complete  # adds check data for transmission
+
+    def __repr__(self):
+        return f'IrProtocol({self.name})'
+
+    @property
+    def symbols(self):
+        return [self.zero, self.one, self.leader, self.trailer, self.repeat, self.repeat_trailer]
+
+
+def _check_nec(raw_data):
+    if (raw_data[2] ^ raw_data[3]) != 0xff:
+        raise IrError(f'Broken data')
+
+
+def _complete_nec(data):
+    return [data[0], data[1], data[2], ~data[2] & 0xff]
+
+
+def _check_aeha(raw_data):
+    if len(raw_data) < 3:
+        raise IrError(f'Too short data')
+    if (((raw_data[0] ^ raw_data[1]) >> 4) ^ ((raw_data[0] ^ raw_data[1]) & 0xf)) != (raw_data[2] & 0xf):
+        raise IrError(f'Broken customer code')
+
+
+NEC = IrProtocol(
+    'NEC', 562,
+    leader=(16, 8),
+    zero=(1, 1),
+    one=(1, 3),
+    trailer=(1, 4),
+    repeat=(16, 4),
+    repeat_trailer=(1, 1),
+    bits=32,
+    period=108000,
+    check=_check_nec,
+    complete=_complete_nec)
+
+AEHA = IrProtocol(
+    'AEHA', 425,
+    leader=(8, 4),
+    zero=(1, 1),
+    one=(1, 3),
+    trailer=(1, 4),
+    end_space=8000,
+    repeat=(8, 8),
+    repeat_trailer=(1, 1),
+    period=130000,
+    check=_check_aeha)
+
+SONY = IrProtocol(
+    'SONY', 600,
+    leader=(4, 1),
+    zero=(1, 1),
+    one=(2, 1),
+    bits=12,
+    frequency=40000,
+    period=45000)
+
+PROTOCOLS = {
+    'nec': NEC,
+    'aeha': AEHA,
+    'sony': SONY,
+}
@@ -1,145 +1,348 @@
+import collections
+import os
 import pigpio
+import select
+import struct
+import threading
 from .error import IrError
+from .frame import IrFrame, IrEventCoalescer
+from .protocol import NEC, AEHA
 
 
 class IrCodeAnalyzer:
-    def __init__(self, time, err_rate):
-        self._time = time
-        self._err_rate = err_rate
-        self._time_min = int(time * (1 - err_rate))
-        self._time_max = int(time * (1 + err_rate))
-
-    def _in_range(self, duration, length):
-        return duration > self._time_min * length and duration < self._time_max * length
-
+    _SPACE_OPEN = 1 << 62  # upper bound of a space ending a frame
+    _NEVER = (0, 0, 0, 0)  # bounds of a code not used by the protocol
 
-class IrCodeAnalyzerNec(IrCodeAnalyzer):
-    def __init__(self, err_rate):
-        super(IrCodeAnalyzerNec, self).__init__(562, err_rate)
-        self._raw_data = [0, 0, 0, 0]
+    def __init__(self, protocol, err_rate):
+        self.protocol = protocol
+        self._err_rate = err_rate
+        self._time_min = int(protocol.unit * (1 - err_rate))
+        self._time_max = int(protocol.unit * (1 + err_rate))
+        self._bits = protocol.bits
+        self._leader = self._bounds(protocol.leader)
+        self._data0 = self._bounds(protocol.zero)
+        self._data1 = self._bounds(protocol.one)
+        if protocol.trailer is None:
+            self._end = self._NEVER
+            self._data0_last = self._open_bounds(protocol.zero, self._time_min * protocol.zero[1])
+            self._data1_last = self._open_bounds(protocol.one, self._time_min * protocol.one[1])
+        else:
+            if protocol.end_space is None:
+                end_min = self._time_min * protocol.trailer[1]
+            else:
+                end_min = int(protocol.end_space * (1 - err_rate)) - 1
+            self._end = self._open_bounds(protocol.trailer, end_min)
+            self._data0_last = self._data0
+            self._data1_last = self._data1
+        if protocol.repeat is None:
+            self._repeat = self._NEVER
+            self._repeat_end = self._NEVER
+        else:
+            self._repeat = self._bounds(protocol.repeat)
+            self._repeat_end = self._open_bounds(
+                protocol.repeat_trailer, self._time_min * protocol.repeat_trailer[1])
+        # longest mark or space inside a frame, the open space ending a frame is excluded
+        self._duration_max = max(
+            self._leader[1], self._leader[3], self._data0[1], self._data0[3], self._data1[1], self._data1[3],
+            self._repeat[1], self._repeat[3], self._end[1], self._repeat_end[1])
+        self._raw_data = []
+        self.position = 0  # cursor after the last analyzed code
+        self.repeat_count = 0  # repeat codes following the frame
 
     def __str__(self):
         data = ', '.join(hex(d) for d in self._raw_data)
-        return f'NEC: [{data}]'
+        if self.repeat_count:
+            return f'{self.protocol.name}: [{data}] (repeat {self.repeat_count})'
+        return f'{self.protocol.name}: [{data}]'
 
-    def _is_leader(self, code):
-        return self._in_range(code[0], 16) and self._in_range(code[1], 8)
+    def _bounds(self, pattern):
+        mark, space = pattern
+        return (self._time_min * mark, self._time_max * mark,
+                self._time_min * space, self._time_max * space)
 
-    def _is_data0(self, code):
-        return self._in_range(code[0], 1) and self._in_range(code[1], 1)
+    def _open_bounds(self, pattern, space_min):
+        mark, _ = pattern
+        return (self._time_min * mark, self._time_max * mark, space_min, self._SPACE_OPEN)
 
-    def _is_data1(self, code):
-        return self._in_range(code[0], 1) and self._in_range(code[1], 3)
+    def max_duration(self):
+        return self._duration_max
+
+    def _deviation(self, pattern, code):
+        # largest relative difference of the mark and space from the nominal durations
+        unit = self.protocol.unit
+        mark, space = pattern
+        return max(abs(code[0] - unit * mark) / (unit * mark), abs(code[1] - unit * space) / (unit * space))
+
+    def _is_leader(self, code):
+        high_min, high_max, low_min, low_max = self._leader
+        return high_min < code[0] < high_max and low_min < code[1] < low_max
 
     def _is_repeat(self, code):
-        return self._in_range(code[0], 16) and self._in_range(code[1], 4)
+        high_min, high_max, low_min, low_max = self._repeat
+        return high_min < code[0] < high_max and low_min < code[1] < low_max
 
     def _is_end(self, code):
-        return self._in_range(code[0], 1) and code[1] > self._time_min * 4
+        high_min, high_max, low_min, low_max = self._end
+        return high_min < code[0] < high_max and low_min < code[1] < low_max
 
     def _is_repeat_end(self, code):
-        return self._in_range(code[0], 1) and code[1] > self._time_min
+        high_min, high_max, low_min, low_max = self._repeat_end
+        return high_min < code[0] < high_max and low_min < code[1] < low_max
+
+    def _bit_value(self, code):
+        high, low = code
+        high_min, high_max, low_min, low_max = self._data1
+        if high_min < high < high_max and low_min < low < low_max:
+            return 1
+        high_min, high_max, low_min, low_max = self._data0
+        if high_min < high < high_max and low_min < low < low_max:
+            return 0
+        raise IrError(f'Unknown data code: {code}')
+
+    def _last_bit_value(self, code):
+        high, low = code
+        high_min, high_max, low_min, low_max = self._data1_last
+        if high_min < high < high_max and low_min < low < low_max:
+            return 1
+        high_min, high_max, low_min, low_max = self._data0_last
+        if high_min < high < high_max and low_min < low < low_max:
+            return 0
+        raise IrError(f'Unknown data code: {code}')
+
+    def _check(self, raw_data):
+        if self.protocol.check is not None:
+            self.protocol.check(raw_data)
+
+    def frame(self, tick=0):
+        return IrFrame(self.protocol, tuple(self._raw_data), self.repeat_count, tick)
 
     def analyze(self, codes):
-        if not self._is_leader(codes[0]):
+        try:
+            return self.analyze_at(codes, 0)
+        finally:
+            del codes[:self.position]
+
+    def analyze_at(self, codes, pos):
+        self.position = pos
+        if not self._is_leader(codes[pos]):
             return False
-        codes.pop(0)
-        self._raw_data = [0, 0, 0, 0]
-        raw_data = self._raw_data
-        for i in range(4):
-            val = 0
-            for j in range(8):
-                code = codes.pop(0)
-                if self._is_data1(code):
-                    val ^= 1 << j
-                elif not self._is_data0(code):
-                    raise IrError(f'Unknown data code: {code}')
-            raw_data[i] = val
-        if (raw_data[2] ^ raw_data[3]) != 0xff:
-            raise IrError(f'Broken data')
-        code = codes.pop(0)
-        if not self._is_end(code):
-            raise IrError(f'Unknown end code: {code}')
-        while codes:
-            if not self._is_repeat(codes[0]):
-                return True
-            codes.pop(0)
-            if not codes:
+        pos += 1
+        bits = self._bits
+        last = -1 if bits is None else bits - 1
+        raw_data = []
+        val = 0
+        bit = 0
+        try:
+            while bit != bits:
+                code = codes[pos]
+                pos += 1
+                if bits is None and (bit & 7) == 0 and self._is_end(code):
+                    break
+                if bit == last:
+                    val ^= self._last_bit_value(code) << (bit & 7)
+                else:
+                    val ^= self._bit_value(code) << (bit & 7)
+                bit += 1
+                if (bit & 7) == 0:
+                    raw_data.append(val)
+                    val = 0
+            if (bit & 7) != 0:
+                raw_data.append(val)
+            self._raw_data = raw_data
+            self._check(raw_data)
+            if bits is not None and self.protocol.trailer is not None:
+                code = codes[pos]
+                pos += 1
+                if not self._is_end(code):
+                    raise IrError(f'Unknown end code: {code}')
+        finally:
+            self.position = pos
+        self.position = self._analyze_repeat(codes, pos)
+        return True
+
+    def _analyze_repeat(self, codes, pos):
+        self.repeat_count = 0
+        end = len(codes)
+        while pos < end:
+            if not self._is_repeat(codes[pos]):
+                return pos
+            pos += 1
+            if pos >= end:
+                self.position = pos
                 raise IrError(f'No end code')
-            code = codes.pop(0)
+            code = codes[pos]
+            pos += 1
             if not self._is_repeat_end(code):
+                self.position = pos
                 raise IrError(f'Unknown repeat end code: {code}')
-        return True
+            self.repeat_count += 1
+        return pos
+
+
+class IrCodeAnalyzerNec(IrCodeAnalyzer):
+    def __init__(self, err_rate):
+        super(IrCodeAnalyzerNec, self).__init__(NEC, err_rate)
 
 
 class IrCodeAnalyzerAeha(IrCodeAnalyzer):
     def __init__(self, err_rate):
-        super(IrCodeAnalyzerAeha, self).__init__(425, err_rate)
-        self._end_time_min = int(8000 * (1 - err_rate))
-        self._raw_data = []
+        super(IrCodeAnalyzerAeha, self).__init__(AEHA, err_rate)
 
-    def __str__(self):
-        data = ', '.join(hex(d) for d in self._raw_data)
-        return f'AEHA: [{data}]'
 
-    def _is_leader(self, code):
-        return self._in_range(code[0], 8) and self._in_range(code[1], 4)
+class IrLeaderIndex:
+    _SHIFT = 8  # durations are quantized by 256us
 
-    def _is_data0(self, code):
-        return self._in_range(code[0], 1) and self._in_range(code[1], 1)
+    def __init__(self, analyzers):
+        shift = self._SHIFT
+        index = {}
+        for analyzer in analyzers:
+            high_min, high_max, low_min, low_max = analyzer._leader
+            for high in range(high_min >> shift, (high_max >> shift) + 1):
+                for low in range(low_min >> shift, (low_max >> shift) + 1):
+                    index.setdefault((high, low), []).append(analyzer)
+        self._index = {key: tuple(value) for key, value in index.items()}
 
-    def _is_data1(self, code):
-        return self._in_range(code[0], 1) and self._in_range(code[1], 3)
+    def lookup(self, code):
+        return self._index.get((code[0] >> self._SHIFT, code[1] >> self._SHIFT), ())
 
-    def _is_repeat(self, code):
-        return self._in_range(code[0], 8) and self._in_range(code[1], 8)
 
-    def _is_end(self, code):
-        return self._in_range(code[0], 1) and code[1] >= self._end_time_min
+class IrStreamDecoder:
+    _OPEN_SPACE = 0xffffffff  # space of a mark whose end is not seen yet
 
-    def _is_repeat_end(self, code):
-        return self._in_range(code[0], 1) and code[1] >= self._time_min
+    _STATE_IDLE = 0
+    _STATE_DATA = 1
+    _STATE_REPEAT = 2
+    _STATE_TRAILER = 3
+    _STATE_SKIP = 4
 
-    def analyze(self, codes):
-        if not self._is_leader(codes[0]):
-            return False
-        codes.pop(0)
-        self._raw_data = []
-        raw_data = self._raw_data
-        while True:
-            val = 0
-            for j in range(8):
-                code = codes.pop(0)
-                if j == 0 and self._is_end(code):
-                    break
-                elif self._is_data1(code):
-                    val ^= 1 << j
-                elif not self._is_data0(code):
-                    raise IrError(f'Unknown data code: {code}')
+    def __init__(self, analyzers, handler):
+        self._leader_index = IrLeaderIndex(analyzers)
+        self._handler = handler  # event handler
+        self._state = self._STATE_IDLE
+        self._analyzer = None  # analyzer of current frame
+        self._last_analyzer = None  # analyzer accepting repeat codes
+        self._last_frame = None  # frame of the repeat codes
+        self._leader_tick = 0  # tick of the leader of current frame
+        self.tick = 0  # tick at the end of the fed code, set by the receiver
+        self._raw_data = []  # bytes of current frame
+        self._val = 0  # current byte
+        self._bit = 0  # number of bits received
+
+    def forget(self):
+        self._last_analyzer = None
+
+    def reset(self):
+        if self._state in (self._STATE_DATA, self._STATE_REPEAT):
+            self._error(IrError(f'No end code'))
+        self._state = self._STATE_IDLE
+
+    def feed_mark(self, high):
+        state = self._state
+        if state == self._STATE_DATA:
+            analyzer = self._analyzer
+            bits = analyzer._bits
+            if bits is None:
+                return
+            if self._bit == bits:
+                if not analyzer._is_end((high, self._OPEN_SPACE)):
+                    self._error(IrError(f'Unknown end code: {high}'))
+                    return
+            elif self._bit == bits - 1 and analyzer.protocol.trailer is None:
+                try:
+                    self._push_bit(analyzer._last_bit_value((high, self._OPEN_SPACE)))
+                except IrError as ex:
+                    self._error(ex)
+                    return
             else:
-                raw_data.append(val)
-                continue
-            break
-        if len(raw_data) < 3:
-            raise IrError(f'Too short data')
-        if (((raw_data[0] ^ raw_data[1]) >> 4) ^ ((raw_data[0] ^ raw_data[1]) & 0xf)) != (raw_data[2] & 0xf):
-            raise IrError(f'Broken customer code')
-        while codes:
-            if not self._is_repeat(codes[0]):
-                return True
-            codes.pop(0)
-            if not codes:
-                raise IrError(f'No end code')
-            code = codes.pop(0)
-            if not self._is_repeat_end(code):
-                raise IrError(f'Unknown repeat end code: {code}')
-        return True
+                return
+            self._emit_frame()
+            self._state = self._STATE_TRAILER
+        elif state == self._STATE_REPEAT:
+            analyzer = self._analyzer
+            if not analyzer._is_repeat_end((high, self._OPEN_SPACE)):
+                self._error(IrError(f'Unknown repeat end code: {high}'))
+                return
+            frame = self._last_frame._replace(repeat=self._last_frame.repeat + 1)
+            self._last_frame = frame
+            self._state = self._STATE_TRAILER
+            self._handler(frame)
+
+    def feed(self, code):
+        state = self._state
+        if state == self._STATE_DATA:
+            analyzer = self._analyzer
+            if analyzer._bits is None and (self._bit & 7) == 0 and analyzer._is_end(code):
+                self._emit_frame()
+                self._state = self._STATE_IDLE
+                return
+            try:
+                self._push_bit(analyzer._bit_value(code))
+            except IrError as ex:
+                self._error(ex)
+        elif state == self._STATE_IDLE:
+            leader_analyzer = None
+            for analyzer in self._leader_index.lookup(code):
+                if analyzer._is_leader(code):
+                    leader_analyzer = analyzer
+                    break
+            analyzer = self._last_analyzer
+            if analyzer is not None and analyzer._is_repeat(code):
+                # windows of a leader and a repeat code overlap at high error rates
+                if leader_analyzer is None or (
+                        analyzer._deviation(analyzer.protocol.repeat, code) <
+                        leader_analyzer._deviation(leader_analyzer.protocol.leader, code)):
+                    self._analyzer = analyzer
+                    self._state = self._STATE_REPEAT
+                    return
+            if leader_analyzer is not None:
+                self._analyzer = leader_analyzer
+                self._raw_data = []
+                self._val = 0
+                self._bit = 0
+                self._leader_tick = (self.tick - code[0] - code[1]) & 0xffffffff
+                self._state = self._STATE_DATA
+                return
+            self._last_analyzer = None
+            self._handler(IrError(f'Unknown leader: {code}'))
+        elif state == self._STATE_TRAILER:
+            self._state = self._STATE_IDLE
+        elif state == self._STATE_REPEAT:
+            self._error(IrError(f'Unknown repeat end code: {code}'))
+
+    def _push_bit(self, value):
+        self._val ^= value << (self._bit & 7)
+        self._bit += 1
+        if (self._bit & 7) == 0:
+            self._raw_data.append(self._val)
+            self._val = 0
+
+    def _emit_frame(self):
+        analyzer = self._analyzer
+        if (self._bit & 7) != 0:
+            self._raw_data.append(self._val)
+        try:
+            analyzer._check(self._raw_data)
+        except IrError as ex:
+            self._error(ex)
+            return
+        frame = IrFrame(analyzer.protocol, tuple(self._raw_data), 0, self._leader_tick)
+        self._last_analyzer = analyzer
+        self._last_frame = frame
+        self._handler(frame)
+
+    def _error(self, ex):
+        self._state = self._STATE_SKIP
+        self._last_analyzer = None
+        self._handler(ex)
 
 
 class IrReceiver:
     _DURATION_MAX = 400
+    _REPORT = struct.Struct('HHII')  # gpioReport_t of notification pipe
+    _REPORTS_PER_READ = 512
 
-    def __init__(self, pi, gpio, handler, err_rate):
+    def __init__(self, pi, gpio, handler, err_rate, streaming=False, threaded=False, queue_size=4096,
+                 notify=False, protocols=None, raw_handler=None, events=False, hold_interval=0.5):
         self._pi = pi
         self._gpio = gpio
         self._cb = None  # for cancel callback
@@ -147,11 +350,39 @@ class IrReceiver:
         self._last_high_duration = 0  # last duration of high
         self._is_analyzing = False  # is analyzing input
         self._analyzing_codes = []  # codes currently analyzing
+        self._burst_start_tick = 0  # first tick of current burst
+        if protocols is None:
+            protocols = [NEC, AEHA]
+        # watchdog to detect release after the end of a burst
+        self._release_ms = max(protocol.period for protocol in protocols) * 3 // 2000 + 1
+        self._coalescer = None  # converts frames to press, hold and release events
+        if events:
+            self._coalescer = IrEventCoalescer(handler, hold_interval, self._release_ms / 1000)
+            handler = self._coalescer
         self._handler = handler  # event handler
-        self._analyzers = [
-            IrCodeAnalyzerNec(err_rate),
-            IrCodeAnalyzerAeha(err_rate),
-        ]
+        self._raw_handler = raw_handler  # receives raw codes of each burst
+        self._analyzers = [IrCodeAnalyzer(protocol, err_rate) for protocol in protocols]
+        self._leader_index = IrLeaderIndex(self._analyzers)
+        self._decoder = None  # incremental decoder for streaming
+        self._gap_ms = self._DURATION_MAX  # watchdog to detect end of burst
+        self._burst_end_tick = 0  # last tick of previous burst
+        if streaming:
+            self._decoder = IrStreamDecoder(self._analyzers, handler)
+            self._gap_ms = max(a.max_duration() for a in self._analyzers) // 1000 + 1
+        self._queue = None  # raw edges waiting for the worker thread
+        self._queue_size = queue_size
+        self._queue_event = threading.Event()
+        self._worker = None  # thread decoding queued edges
+        self._is_working = False
+        self.max_queue_depth = 0
+        self.dropped_edges = 0
+        if threaded:
+            self._queue = collections.deque()
+        self._use_notify = notify
+        self._notify_handle = None  # handle of notification pipe
+        self._notify_fd = None
+        self._notify_reader = None  # thread reading notification pipe
+        self._notify_level = 0  # last level of gpio in notification
 
     def __enter__(self):
         self.start()
@@ -161,15 +392,116 @@ class IrReceiver:
         self.stop()
 
     def start(self):
-        if self._cb:
+        if self._cb or self._notify_handle is not None:
             raise RuntimeError('IrReceiver already started')
-        self._cb = self._pi.callback(
-            self._gpio, pigpio.EITHER_EDGE, self._edge_callback)
+        if self._decoder is not None:
+            callback = self._stream_edge_callback
+        else:
+            callback = self._edge_callback
+        if self._queue is not None:
+            self._is_working = True
+            self._worker = threading.Thread(
+                target=self._dispatch_worker, args=(callback,), daemon=True)
+            self._worker.start()
+            callback = self._queue_edge
+        if self._use_notify:
+            self._start_notify(callback)
+        else:
+            self._cb = self._pi.callback(self._gpio, pigpio.EITHER_EDGE, callback)
 
     def stop(self):
         if self._cb is not None:
             self._cb.cancel()
             self._cb = None
+        if self._notify_handle is not None:
+            self._stop_notify()
+        if self._worker is not None:
+            self._is_working = False
+            self._queue_event.set()
+            self._worker.join()
+            self._worker = None
+
+    def _start_notify(self, callback):
+        self._notify_handle = self._pi.notify_open()
+        try:
+            self._notify_fd = os.open(f'/dev/pigpio{self._notify_handle}', os.O_RDONLY | os.O_NONBLOCK)
+            self._notify_level = self._pi.read(self._gpio)
+            self._notify_reader = threading.Thread(
+                target=self._read_notify, args=(callback,), daemon=True)
+            self._notify_reader.start()
+            self._pi.notify_begin(self._notify_handle, 1 << self._gpio)
+        except:
+            self._stop_notify()
+            raise
+
+    def _stop_notify(self):
+        handle = self._notify_handle
+        self._notify_handle = None
+        if self._notify_reader is not None:
+            self._notify_reader.join()
+            self._notify_reader = None
+        if self._notify_fd is not None:
+            os.close(self._notify_fd)
+            self._notify_fd = None
+        self._pi.notify_close(handle)
+
+    def _read_notify(self, callback):
+        fd = self._notify_fd
+        read_size = self._REPORT.size * self._REPORTS_PER_READ
+        buf = b''
+        while self._notify_handle is not None:
+            readable, _, _ = select.select([fd], [], [], 0.1)
+            if not readable:
+                continue
+            data = os.read(fd, read_size)
+            if not data:
+                break
+            buf += data
+            buf = self._feed_reports(buf, callback)
+
+    def _feed_reports(self, buf, callback):
+        size = len(buf) - len(buf) % self._REPORT.size
+        gpio = self._gpio
+        bit = 1 << gpio
+        level = self._notify_level
+        for _, flags, tick, levels in self._REPORT.iter_unpack(memoryview(buf)[:size]):
+            if flags == 0:
+                new_level = 1 if levels & bit else 0
+                if new_level != level:
+                    level = new_level
+                    callback(gpio, level, tick)
+            elif (flags & pigpio.NTFY_FLAGS_WDOG) and (flags & pigpio.NTFY_FLAGS_GPIO) == gpio:
+                callback(gpio, pigpio.TIMEOUT, tick)
+        self._notify_level = level
+        return buf[size:]
+
+    @property
+    def queue_depth(self):
+        if self._queue is None:
+            return 0
+        return len(self._queue)
+
+    def _queue_edge(self, gpio, level, tick):
+        queue = self._queue
+        depth = len(queue)
+        if depth >= self._queue_size:
+            self.dropped_edges += 1
+            return
+        queue.append((tick, level))
+        if depth >= self.max_queue_depth:
+            self.max_queue_depth = depth + 1
+        self._queue_event.set()
+
+    def _dispatch_worker(self, callback):
+        gpio = self._gpio
+        queue = self._queue
+        event = self._queue_event
+        while self._is_working:
+            event.wait()
+            event.clear()
+            while queue:
+                tick, level = queue.popleft()
+                callback(gpio, level, tick)
 
     def _edge_callback(self, gpio, level, tick):
         last_tick = self._last_tick
@@ -182,21 +514,39 @@ class IrReceiver:
                 self._analyzing_codes.append(
                     (high_duration, self._DURATION_MAX * 1000))
                 codes = self._analyzing_codes
-                while codes:
-                    try:
-                        for analyzer in self._analyzers:
-                            if analyzer.analyze(codes):
-                                self._handler(analyzer)
-                                break
-                        else:
-                            code = codes.pop(0)
-                            raise IrError(f'Unknown leader: {code}')
-                    except IrError as ex:
-                        self._handler(ex)
+                if self._raw_handler is not None:
+                    self._raw_handler(list(codes))
+                pos = 0
+                end = len(codes)
+                leader_index = self._leader_index
+                leader_tick = self._burst_start_tick  # tick at codes[ticked]
+                ticked = 0
+                while pos < end:
+                    for analyzer in leader_index.lookup(codes[pos]):
+                        try:
+                            if not analyzer.analyze_at(codes, pos):
+                                continue
+                        except IrError as ex:
+                            pos = analyzer.position
+                            self._handler(ex)
+                            break
+                        leader_tick += sum(high + low for high, low in codes[ticked:pos])
+                        ticked = pos
+                        pos = analyzer.position
+                        self._handler(analyzer.frame(leader_tick & 0xffffffff))
+                        break
+                    else:
+                        code = codes[pos]
+                        pos += 1
+                        self._handler(IrError(f'Unknown leader: {code}'))
+                codes.clear()
                 self._last_high_duration = 0
+                if self._coalescer is not None:
+                    self._coalescer.release(last_tick)
             return
         if not self._is_analyzing:
             self._is_analyzing = True
+            self._burst_start_tick = tick
             self._pi.set_watchdog(gpio, self._DURATION_MAX)
             return
         if tick >= last_tick:
@@ -209,3 +559,51 @@ class IrReceiver:
             self._analyzing_codes.append(
                 (self._last_high_duration, duration))
             self._last_high_duration = 0
+
+    def _stream_edge_callback(self, gpio, level, tick):
+        last_tick = self._last_tick
+        self._last_tick = tick
+        decoder = self._decoder
+        decoder.tick = tick
+        if level == pigpio.TIMEOUT:
+            if not self._is_analyzing:
+                # no repeat of the held button
+                self._pi.set_watchdog(gpio, 0)
+                if self._coalescer is not None:
+                    self._coalescer.release(self._burst_end_tick)
+                return
+            self._is_analyzing = False
+            self._pi.set_watchdog(gpio, 0)
+            self._burst_end_tick = last_tick
+            high_duration = self._last_high_duration
+            if high_duration != 0:
+                code = (high_duration, self._DURATION_MAX * 1000)
+                decoder.feed(code)
+                self._last_high_duration = 0
+                if self._raw_handler is not None:
+                    self._analyzing_codes.append(code)
+                    self._raw_handler(list(self._analyzing_codes))
+            self._analyzing_codes.clear()
+            decoder.reset()
+            if self._coalescer is not None and self._coalescer.is_held:
+                self._pi.set_watchdog(gpio, self._release_ms)
+            return
+        if not self._is_analyzing:
+            self._is_analyzing = True
+            self._pi.set_watchdog(gpio, self._gap_ms)
+            if ((tick - self._burst_end_tick) & 0xffffffff) > self._DURATION_MAX * 1000:
+                decoder.forget()
+            return
+        if tick >= last_tick:
+            duration = tick - last_tick
+        else:
+            duration = 4294967295 - last_tick + tick
+        if level == pigpio.HIGH:
+            self._last_high_duration = duration
+            decoder.feed_mark(duration)
+        elif level == pigpio.LOW:
+            code = (self._last_high_duration, duration)
+            decoder.feed(code)
+            self._last_high_duration = 0
+            if self._raw_handler is not None:
+                self._analyzing_codes.append(code)
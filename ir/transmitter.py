@@ -1,188 +1,86 @@
+import asyncio
+import collections
+import concurrent.futures
+import math
 import pigpio
 import time
+from .compiler import IrPulseCompiler
+from .protocol import NEC, AEHA
 
 
-class IrCodeGenerator:
-    pass
+_SNAP_RATE = 0.15  # durations up to this rate above the shortest one of a cluster are snapped together
 
 
-class IrCodeGeneratorNec(IrCodeGenerator):
-    BASE_PULSES = [
-        [  # data0
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18 + 562 * 1),  # T + T
-        ],
-        [  # data1
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18 + 562 * 3),  # T + 3T
-        ],
-        [  # leader
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 1T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 2T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 3T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 4T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 5T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 6T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 7T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 8T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 9T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 10T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 11T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 12T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 13T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 14T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),  # 15T
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18 + 562 * 8),  # 16T + 8T
-        ],
-        [  # end
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18 + 562 * 4),  # T + 4T
-        ],
-    ]
+def _snap(durations):
+    # replaces jittered durations with the mean of their cluster, so a capture has a few distinct durations
+    snapped = {}
+    cluster = []
+    for duration in sorted(durations):
+        if cluster and duration > cluster[0] * (1 + _SNAP_RATE):
+            mean = round(sum(cluster) / len(cluster))
+            snapped.update((item, mean) for item in cluster)
+            cluster = []
+        cluster.append(duration)
+    if cluster:
+        mean = round(sum(cluster) / len(cluster))
+        snapped.update((item, mean) for item in cluster)
+    return [snapped[duration] for duration in durations]
 
-    def __init__(self):
-        self.pulses = []
 
-    def _generate_byte(self, code):
-        pulses = self.pulses
-        for _ in range(8):
-            if (code & 1) == 0:
-                pulses.append(0)
-            else:
-                pulses.append(1)
-            code >>= 1
+class IrCodeGenerator:
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.pulses = []  # indexes of protocol symbols
+        self.repeat = 0
+        if protocol.repeat is None:
+            self.repeat_pulses = self.pulses
+        else:
+            self.repeat_pulses = [4, 5]
 
-    def generate(self, data):
+    def generate(self, data, repeat=0):
+        protocol = self.protocol
+        if protocol.complete is not None:
+            data = protocol.complete(data)
+        bits = protocol.bits
+        if bits is None:
+            bits = len(data) * 8
+        self.repeat = repeat
         pulses = self.pulses
         pulses.clear()
         pulses.append(2)
-        self._generate_byte(data[0])
-        self._generate_byte(data[1])
-        self._generate_byte(data[2])
-        self._generate_byte(~data[2])
-        pulses.append(3)
+        for i in range(bits):
+            pulses.append((data[i >> 3] >> (i & 7)) & 1)
+        if protocol.trailer is not None:
+            pulses.append(3)
 
 
-class IrCodeGeneratorAeha(IrCodeGenerator):
-    BASE_PULSES = [
-        [  # data0
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18 + 425 * 1),  # T + T
-        ],
-        [  # data1
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18 + 425 * 3),  # T + 3T
-        ],
-        [  # leader
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),  # T
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),  # 2T
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),  # 3T
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),  # 4T
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),  # 5T
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),  # 6T
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),  # 7T
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18 + 425 * 4),  # 8T + 4T
-        ],
-        [  # end
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18),
-            (8, 18), (8, 18), (8, 18), (8, 18 + 425 * 4),  # T + 8000us
-        ],
-    ]
-
+class IrCodeGeneratorNec(IrCodeGenerator):
     def __init__(self):
-        self.pulses = []
+        super(IrCodeGeneratorNec, self).__init__(NEC)
 
-    def _generate_byte(self, code):
-        pulses = self.pulses
-        for _ in range(8):
-            if (code & 1) == 0:
-                pulses.append(0)
-            else:
-                pulses.append(1)
-            code >>= 1
 
-    def generate(self, data):
-        pulses = self.pulses
-        pulses.clear()
-        pulses.append(2)
-        for d in data:
-            self._generate_byte(d)
-        pulses.append(3)
+class IrCodeGeneratorAeha(IrCodeGenerator):
+    def __init__(self):
+        super(IrCodeGeneratorAeha, self).__init__(AEHA)
 
 
 class IrTransmitter:
-    def __init__(self, pi, gpio):
+    _MARGIN_SECS = 0.002  # wait after expected air time before checking completion
+    _RAW_SYMBOLS_MAX = 64  # cached symbol waves of replayed codes, pigpio has 250 wave ids
+
+    def __init__(self, pi, gpio, frequency=None, duty_cycle=0.3, max_wave_cycles=32):
         self._pi = pi
         self._gpio = gpio
+        self._frequency = frequency  # carrier frequency overriding generators
+        self._compiler = IrPulseCompiler(pi, gpio, duty_cycle, max_wave_cycles)
+        self._compiled = {}  # compiled symbols per protocol and gpio
+        self._build_secs = {}  # time to compile symbols per protocol and gpio
+        self._raw_symbols = collections.OrderedDict()  # compiled (frequency, cycles, space) of replay in LRU order
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.build_secs = 0.0  # total time spent building waves
+        self.saved_secs = 0.0  # total build time saved by cached waves
+        self._executor = None  # serializes transmissions
 
     def __enter__(self):
         self.start()
@@ -191,26 +89,224 @@ class IrTransmitter:
     def __exit__(self, exc_type, exc_value, traceback):
         self.stop()
 
+    @property
+    def wave_pulses(self):
+        return self._compiler.wave_pulses
+
     def start(self):
+        if self._executor is not None:
+            raise RuntimeError('IrTransmitter already started')
         self._pi.set_mode(self._gpio, pigpio.OUTPUT)
+        self._pi.wave_clear()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
 
     def stop(self):
-        pass
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._compiler.clear()
+        self._compiled.clear()
+        self._build_secs.clear()
+        self._raw_symbols.clear()
+
+    def _compile(self, generator):
+        key = (generator.protocol, self._gpio)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self.cache_hits += 1
+            self.saved_secs += self._build_secs[key]
+            return compiled
+        start = time.perf_counter()
+        compiled = self._compiler.compile(generator.protocol, self._frequency)
+        elapsed = time.perf_counter() - start
+        self._compiled[key] = compiled
+        self._build_secs[key] = elapsed
+        self.cache_misses += 1
+        self.build_secs += elapsed
+        return compiled
 
     def transmit(self, generator):
-        gpio_bit = 1 << self._gpio
-        self._pi.wave_clear()
-        base_pulse_map = []
-        for base_pulse in generator.BASE_PULSES:
-            pulses = []
-            for pulse_high, pulse_low in base_pulse:
-                pulses.append(pigpio.pulse(gpio_bit, 0, pulse_high))
-                pulses.append(pigpio.pulse(0, gpio_bit, pulse_low))
-            self._pi.wave_add_generic(pulses)
-            base_pulse_map.append(self._pi.wave_create())
-        pulses = [base_pulse_map[pulse] for pulse in generator.pulses]
-        self._pi.wave_chain(pulses)
+        return self.transmit_async(generator).result()
+
+    def transmit_async(self, generator):
+        if self._executor is None:
+            raise RuntimeError('IrTransmitter not started')
+        return self._executor.submit(
+            self._play, generator, list(generator.pulses), list(generator.repeat_pulses), generator.repeat)
+
+    def hold(self, generator, duration):
+        return self.hold_async(generator, duration).result()
+
+    def hold_async(self, generator, duration):
+        if self._executor is None:
+            raise RuntimeError('IrTransmitter not started')
+        repeat = max(0, math.ceil(duration * 1000000 / generator.protocol.period) - 1)
+        return self._executor.submit(
+            self._play, generator, list(generator.pulses), list(generator.repeat_pulses), repeat)
+
+    async def send(self, generator):
+        return await asyncio.wrap_future(self.transmit_async(generator))
+
+    def transmit_batch(self, entries):
+        return self.transmit_batch_async(entries).result()
+
+    def transmit_batch_async(self, entries):
+        if self._executor is None:
+            raise RuntimeError('IrTransmitter not started')
+        return self._executor.submit(self._play_batch, list(entries))
+
+    def replay(self, codes, frequency=38000):
+        return self.replay_async(codes, frequency).result()
+
+    def replay_async(self, codes, frequency=38000):
+        if self._executor is None:
+            raise RuntimeError('IrTransmitter not started')
+        return self._executor.submit(self._play_raw, list(codes), frequency)
+
+    def _build_raw(self, codes, frequency):
+        period = round(1000000 / frequency)
+        # snap and quantize to carrier periods so that jittered codes share waves,
+        # trailing space is the receiver timeout
+        highs = _snap([high for high, _ in codes])
+        lows = _snap([low for _, low in codes[:-1]]) + [0]
+        keys = [(max(1, round(high / period)), round(low / period) * period) for high, low in zip(highs, lows)]
+        runs = []  # [key, run] of consecutive same keys
+        for key in keys:
+            if runs and runs[-1][0] == key:
+                runs[-1][1] += 1
+            else:
+                runs.append([key, 1])
+        # long marks are loops, runs of short marks collapse into a loop
+        loops = sum(run if self._compiler.is_looped(key[0]) else int(run > 7) for key, run in runs)
+        if loops > self._compiler.LOOP_MAX:
+            raise ValueError(f'Too many loops in wave chain: {loops}')
+        symbols = self._raw_symbols
+        used = {(frequency, *key) for key, _ in runs}
+        missing = 0
+        for symbol in used:
+            if symbol in symbols:
+                symbols.move_to_end(symbol)
+            else:
+                missing += 1
+        # least recently used waves are deleted before new ones are created
+        while symbols and len(symbols) + missing > self._RAW_SYMBOLS_MAX:
+            symbol = next(iter(symbols))
+            if symbol in used:
+                break
+            self._compiler.release_symbol(symbols.pop(symbol)[0])
+        chain = []
+        air_time = 0
+        for key, run in runs:
+            compiled = symbols.get((frequency, *key))
+            if compiled is None:
+                compiled = self._compiler.compile_symbol(frequency, *key)
+                symbols[(frequency, *key)] = compiled
+            fragment, duration = compiled
+            if len(fragment) == 1 and run > 7:
+                chain.extend((255, 0, fragment[0], 255, 1, run & 0xff, run >> 8))
+            else:
+                for _ in range(run):
+                    chain.extend(fragment)
+            air_time += duration * run
+        return chain, air_time
+
+    def _play_raw(self, codes, frequency):
+        chain, air_time = self._build_raw(codes, frequency)
+        if len(chain) > self._compiler.CHAIN_MAX:
+            raise ValueError(f'Too long wave chain: {len(chain)}')
+        return self._play_chain(chain, air_time)
+
+    def _build_chain(self, generator, pulses):
+        fragments, durations = self._compile(generator)
+        chain = []
+        air_time = 0
+        for pulse in pulses:
+            chain.extend(fragments[pulse])
+            air_time += durations[pulse]
+        return chain, air_time
+
+    def _count_loops(self, generator, pulses):
+        # loop counters used by the symbols of pulses, known without creating waves
+        symbol_loops = self._compiler.symbol_loops(generator.protocol, self._frequency)
+        return sum(symbol_loops[pulse] for pulse in pulses)
+
+    def _build_repeat(self, generator, pulses, repeat_pulses, repeat):
+        resent = repeat > 0 and generator.protocol.repeat is None
+        if resent:
+            # without repeat code the whole frame is resent, looped once
+            loops = self._count_loops(generator, pulses) + 1
+        else:
+            loops = self._count_loops(generator, pulses)
+            if repeat > 0:
+                loops += self._count_loops(generator, repeat_pulses) * (2 if repeat > 1 else 1)
+            if repeat > 1:
+                loops += 1
+        # checked before any wave is created
+        if loops > self._compiler.LOOP_MAX:
+            raise ValueError(f'Too many loops in wave chain: {loops}')
+        chain, air_time = self._build_chain(generator, pulses)
+        if repeat <= 0:
+            return chain, air_time
+        period = generator.protocol.period
+        if resent:
+            chain = [255, 0] + chain
+            chain.extend(self._compiler.delay(period - air_time))
+            chain.extend((255, 1, (repeat + 1) & 0xff, (repeat + 1) >> 8))
+            return chain, max(period, air_time) * (repeat + 1)
+        chain.extend(self._compiler.delay(period - air_time))
+        repeat_chain, repeat_time = self._build_chain(generator, repeat_pulses)
+        if repeat > 1:
+            chain.extend((255, 0))
+            chain.extend(repeat_chain)
+            chain.extend(self._compiler.delay(period - repeat_time))
+            chain.extend((255, 1, (repeat - 1) & 0xff, (repeat - 1) >> 8))
+        chain.extend(repeat_chain)
+        return chain, max(period, air_time) + max(period, repeat_time) * (repeat - 1) + repeat_time
+
+    def _play(self, generator, pulses, repeat_pulses, repeat=0):
+        chain, air_time = self._build_repeat(generator, pulses, repeat_pulses, repeat)
+        if len(chain) > self._compiler.CHAIN_MAX:
+            raise ValueError(f'Too long wave chain: {len(chain)}')
+        return self._play_chain(chain, air_time)
+
+    def _play_batch(self, entries):
+        frames = []
+        loops = 0
+        for generator, data, gap, repeat in entries:
+            if repeat <= 0:
+                continue
+            generator.generate(data)
+            pulses = list(generator.pulses)
+            loops += self._count_loops(generator, pulses)
+            if repeat > 1:
+                loops += 1
+            frames.append((generator, pulses, gap, repeat))
+        # checked before any wave is created
+        if loops > self._compiler.LOOP_MAX:
+            raise ValueError(f'Too many loops in wave chain: {loops}')
+        chain = []
+        air_time = 0
+        for generator, pulses, gap, repeat in frames:
+            frame, frame_time = self._build_chain(generator, pulses)
+            gap_time = round(gap * 1000000)
+            frame.extend(self._compiler.delay(gap_time))
+            frame_time += gap_time
+            if repeat > 1:
+                chain.extend((255, 0))
+                chain.extend(frame)
+                chain.extend((255, 1, repeat & 0xff, repeat >> 8))
+            else:
+                chain.extend(frame)
+            air_time += frame_time * repeat
+        if len(chain) > self._compiler.CHAIN_MAX:
+            raise ValueError(f'Too long wave chain: {len(chain)}')
+        return self._play_chain(chain, air_time)
+
+    def _play_chain(self, chain, air_time):
+        air_secs = air_time / 1000000
+        self._pi.wave_chain(chain)
+        time.sleep(air_secs + self._MARGIN_SECS)
         while self._pi.wave_tx_busy():
-            time.sleep(0.1)
+            time.sleep(0.001)
         self._pi.wave_tx_stop()
-        self._pi.wave_clear()
+        return air_secs
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 import argparse
 import pigpio
+import queue
 import re
 import signal
 import sys
-import time
+import threading
 import ir
 import sensor
 
@@ -17,6 +18,16 @@ def on_ir_received(result):
     print(result)
 
 
+learning = threading.Event()
+learned_codes = queue.Queue()
+
+
+def on_ir_raw_received(codes):
+    if learning.is_set():
+        learning.clear()
+        learned_codes.put(codes)
+
+
 def on_motion_detected(level):
     if level:
         print('Motion: ON')
@@ -38,8 +49,24 @@ def main():
         '-r', default=26, help='GPIO pin number of receiver')
     arg_parser.add_argument(
         '-e', type=float, default=0.5, help='Error rate for receiver')
+    arg_parser.add_argument(
+        '-s', action='store_true', help='Decode IR codes while receiving')
+    arg_parser.add_argument(
+        '-w', action='store_true', help='Decode IR codes in a worker thread')
+    arg_parser.add_argument(
+        '-p', action='store_true', help='Capture IR edges from notification pipe')
+    arg_parser.add_argument(
+        '-l', default='ir_library.bin', help='File of learned IR codes')
     arg_parser.add_argument(
         '-d', default=11, help='I2C device id')
+    arg_parser.add_argument(
+        '-c', default='bme680_calibration.json', help='Cache file of BME680 calibration')
+    arg_parser.add_argument(
+        '-i', type=float, default=3, help='Sampling interval of BME680 in seconds')
+    arg_parser.add_argument(
+        '-a', type=int, default=None, help='GPIO pin number of LIS3DH INT1')
+    arg_parser.add_argument(
+        '-o', action='store_true', help='Convert ADT7410 temperature one-shot to save power')
     arg_parser.add_argument(
         '-m', default=27, help='GPIO pin number of motion sensor')
     args = arg_parser.parse_args()
@@ -49,11 +76,13 @@ def main():
     if not pi.connected:
         raise RuntimeError('pigpio is unavailable')
     try:
-        with ir.IrReceiver(pi, args.r, on_ir_received, args.e), \
+        with ir.IrReceiver(pi, args.r, on_ir_received, args.e, streaming=args.s, threaded=args.w,
+                           notify=args.p, raw_handler=on_ir_raw_received, events=True), \
                 ir.IrTransmitter(pi, args.t) as ir_transmitter, \
-                sensor.Bme680(pi, args.d) as bme680, \
-                sensor.Lis3dh(pi, args.d) as lis3dh, \
-                sensor.Adt7410(pi, args.d) as adt7410, \
+                ir.IrLibrary(args.l) as ir_library, \
+                sensor.Bme680(pi, args.d, args.c) as bme680, \
+                sensor.Lis3dh(pi, args.d, args.a) as lis3dh, \
+                sensor.Adt7410(pi, args.d, not args.o, threaded=False) as adt7410, \
                 sensor.Motion(pi, args.m, on_motion_detected, 10):
             bme680.apply_config(
                 osrs_t=sensor.Bme680.OSRS_1,
@@ -65,56 +94,102 @@ def main():
                 heat_temp=300,
                 amb_temp=25)
             lis3dh.apply_config(sensor.Lis3dh.DATA_RATE_100HZ, sensor.Lis3dh.POWER_MODE_NORMAL)
-            while True:
-                print('> ', end='', flush=True)
-                line = sys.stdin.readline().strip()
-                if not line:
-                    continue
-                com, _, com_arg = line.partition(' ')
-                com = com.lower()
-                if 'help'.startswith(com):
-                    print('quit')
-                    print('send nec <DATA>')
-                    print('send aeha <DATA>')
-                    print('get env')
-                    continue
-                elif 'quit'.startswith(com) or 'exit'.startswith(com):
-                    return
-                elif 'send'.startswith(com):
-                    name, _, com_arg = com_arg.partition(' ')
-                    name = name.lower()
-                    if name == 'nec':
-                        generator = ir.IrCodeGeneratorNec()
-                    elif name == 'aeha':
-                        generator = ir.IrCodeGeneratorAeha()
-                    else:
-                        print(f'Not supported: {name}')
+            scheduler = sensor.SensorScheduler()
+            scheduler.add_adt7410(adt7410, 1)
+            scheduler.add_bme680(bme680, args.i)
+            scheduler.add_lis3dh(lis3dh, 0.5)
+            with scheduler:
+                while True:
+                    print('> ', end='', flush=True)
+                    line = sys.stdin.readline().strip()
+                    if not line:
                         continue
-                    com_args = [int(x, 0) for x in re.sub(
-                        r'[\[\]]', '', com_arg).split(',')]
-                    generator.generate(com_args)
-                    ir_transmitter.transmit(generator)
-                    time.sleep(1)
-                elif 'get'.startswith(com):
-                    if com_arg == 'env':
-                        temp_comp = adt7410.get_data()
-                        print(f"Temperature: {temp_comp} C")
-                        print()
-                        temp_comp, hum_comp, press_comp, gas_res = bme680.get_data()
-                        print(f"Temperature: {temp_comp} C")
-                        print(f"Humidity: {hum_comp} %")
-                        print(f"Pressure: {press_comp} hPa")
-                        print(f"Gas resistance: {gas_res} Ohms")
-                        print()
-                        x, y, z = lis3dh.get_data()
-                        print(f"Acceleration X: {x}")
-                        print(f"Acceleration Y: {y}")
-                        print(f"Acceleration Z: {z}")
-                    else:
-                        print(f'Not supported: {com_arg}')
+                    com, _, com_arg = line.partition(' ')
+                    com = com.lower()
+                    if 'help'.startswith(com):
+                        print('quit')
+                        print('send nec <DATA>')
+                        print('send aeha <DATA>')
+                        print('send sony <DATA>')
+                        print('learn <NAME>')
+                        print('replay <NAME>')
+                        print('infer <NAME> [<NAME>...]')
+                        print('get env')
                         continue
-                else:
-                    print('Command not found')
+                    elif 'quit'.startswith(com) or 'exit'.startswith(com):
+                        return
+                    elif 'send'.startswith(com):
+                        name, _, com_arg = com_arg.partition(' ')
+                        name = name.lower()
+                        protocol = ir.PROTOCOLS.get(name)
+                        if protocol is None:
+                            print(f'Not supported: {name}')
+                            continue
+                        generator = ir.IrCodeGenerator(protocol)
+                        com_args = [int(x, 0) for x in re.sub(
+                            r'[\[\]]', '', com_arg).split(',')]
+                        generator.generate(com_args)
+                        ir_transmitter.transmit(generator)
+                    elif 'learn'.startswith(com) and com_arg:
+                        learning.set()
+                        try:
+                            codes = learned_codes.get(timeout=10)
+                        except queue.Empty:
+                            learning.clear()
+                            print('No IR code received')
+                            continue
+                        ir_library.learn(com_arg, codes)
+                        ir_library.save()
+                        print(f'Learned: {com_arg} ({len(codes)} codes)')
+                    elif 'replay'.startswith(com) and com_arg:
+                        if com_arg not in ir_library:
+                            print(f'Not learned: {com_arg}')
+                            continue
+                        codes, frequency = ir_library.get(com_arg)
+                        ir_transmitter.replay(codes, frequency)
+                    elif 'infer'.startswith(com) and com_arg:
+                        from ir import infer as ir_infer  # needs numpy
+                        names = com_arg.split()
+                        missing = [name for name in names if name not in ir_library]
+                        if missing:
+                            print(f'Not learned: {", ".join(missing)}')
+                            continue
+                        try:
+                            protocol = ir_infer.infer_protocol(
+                                [ir_library.get(name)[0] for name in names], 'LEARNED')
+                        except ir.IrError as ex:
+                            print(ex)
+                            continue
+                        print(ir_infer.format_protocol(protocol))
+                    elif 'get'.startswith(com):
+                        if com_arg == 'env':
+                            snapshot = scheduler.read(5)
+                            for name in ('adt7410', 'bme680', 'lis3dh'):
+                                if name not in snapshot.readings:
+                                    print(f'Not sampled: {name}')
+                                    print()
+                                    continue
+                                timestamp, value = snapshot.readings[name]
+                                if name == 'adt7410':
+                                    print(f"Temperature: {value} C")
+                                elif name == 'bme680':
+                                    temp_comp, hum_comp, press_comp, gas_res = value
+                                    print(f"Temperature: {temp_comp} C")
+                                    print(f"Humidity: {hum_comp} %")
+                                    print(f"Pressure: {press_comp} hPa")
+                                    print(f"Gas resistance: {gas_res} Ohms")
+                                else:
+                                    x, y, z = value
+                                    print(f"Acceleration X: {x}")
+                                    print(f"Acceleration Y: {y}")
+                                    print(f"Acceleration Z: {z}")
+                                print(f"Sampled: {snapshot.timestamp - timestamp:.3f} sec ago")
+                                print()
+                        else:
+                            print(f'Not supported: {com_arg}')
+                            continue
+                    else:
+                        print('Command not found')
     finally:
         pi.stop()
 
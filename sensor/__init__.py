@@ -1,11 +1,20 @@
-from .bme680 import Bme680
-from .lis3dh import Lis3dh
+from .bme680 import Bme680, Bme680Calibration, Bme680Compensation, Bme680Sample, Bme680Sampler
+from .lis3dh import Lis3dh, Lis3dhBuffer
 from .adt7410 import Adt7410
 from .motion import Motion
+from .scheduler import SensorScheduler, SensorReading, SensorSnapshot
 
 __all__ = [
     'Bme680',
+    'Bme680Calibration',
+    'Bme680Compensation',
+    'Bme680Sample',
+    'Bme680Sampler',
     'Lis3dh',
+    'Lis3dhBuffer',
     'Adt7410',
     'Motion',
+    'SensorScheduler',
+    'SensorReading',
+    'SensorSnapshot',
 ]
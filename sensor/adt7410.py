@@ -1,14 +1,29 @@
+import pigpio
 import struct
+import threading
 import time
 
 
 class Adt7410:
     I2C_ADDRESS = 0x48
 
-    def __init__(self, pi, bus):
+    _CONFIG_CONTINUOUS = 0b10000000  # 16 bit resolution, continuous conversion
+    _CONFIG_ONE_SHOT = 0b10100000
+    _CONFIG_SHUTDOWN = 0b11100000
+    _CONVERSION_SECS = 0.24
+
+    def __init__(self, pi, bus, continuous=False, threaded=True):
         self._pi = pi
         self._bus = bus
+        self._continuous = continuous  # keeps converting
+        self._threaded = threaded  # reads each conversion of continuous mode in background
         self._handle = None  # I2C handle
+        self._reader = None  # thread reading each conversion
+        self._stopped = threading.Event()
+        self._updated = threading.Event()  # first reading is available
+        self._latest = None  # latest temperature of continuous mode
+        self._timestamp = None  # time.time() of latest
+        self._started = None  # time.monotonic() when continuous conversion started
 
     def __enter__(self):
         self.start()
@@ -22,28 +37,82 @@ class Adt7410:
             raise RuntimeError('Bme680 already started')
         self._handle = self._pi.i2c_open(self._bus, self.I2C_ADDRESS)
         try:
-            self._set_register(0x03, 0b11100000)
+            if not self._continuous:
+                self._set_register(0x03, self._CONFIG_SHUTDOWN)
+                return
+            self._set_register(0x03, self._CONFIG_CONTINUOUS)
+            self._started = time.monotonic()
+            if not self._threaded:
+                return
+            self._stopped.clear()
+            self._updated.clear()
+            self._reader = threading.Thread(target=self._read_continuously, daemon=True)
+            self._reader.start()
         except:
             self.stop()
             raise
 
     def stop(self):
+        if self._reader is not None:
+            self._stopped.set()
+            self._reader.join()
+            self._reader = None
         if self._handle is not None:
+            if self._continuous:
+                self._set_register(0x03, self._CONFIG_SHUTDOWN)
             self._pi.i2c_close(self._handle)
             self._handle = None
 
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    def trigger(self):
+        # starts a one-shot conversion, returns the time.monotonic() when it completes
+        if self._continuous:
+            # the first conversion after start is due a conversion time later
+            return max(time.monotonic(), self._started + self._CONVERSION_SECS)
+        self._set_register(0x03, self._CONFIG_ONE_SHOT)
+        return time.monotonic() + self._CONVERSION_SECS
+
+    def collect(self):
+        # temperature of the conversion, or None if it is not completed yet
+        if not self._continuous:
+            status = self._get_register(0x02)
+            if (status & 0b10000000) != 0:
+                return None
+        base_data = self._get_registers(0x00, 2)
+        data = struct.unpack('>h', base_data)
+        return data[0] / 128
+
     def get_data(self):
-        self._set_register(0x03, 0b10100000)
+        if self._reader is not None:
+            if not self._updated.wait(self._CONVERSION_SECS * 4):
+                raise RuntimeError('Failed to read')
+            return self._latest
+        if self._continuous:
+            time.sleep(max(0, self.trigger() - time.monotonic()))
+            return self.collect()
+        self.trigger()
         for _ in range(10):
             time.sleep(0.3)
-            status = self._get_register(0x02)
-            if (status & 0b10000000) != 0:
-                continue
-            base_data = self._get_registers(0x00, 2)
-            data = struct.unpack('>h', base_data)
-            return data[0] / 128
+            temperature = self.collect()
+            if temperature is not None:
+                return temperature
         raise RuntimeError('Failed to read')
 
+    def _read_continuously(self):
+        next_time = time.monotonic() + self._CONVERSION_SECS
+        while not self._stopped.wait(max(0, next_time - time.monotonic())):
+            next_time += self._CONVERSION_SECS
+            try:
+                data = struct.unpack('>h', self._get_registers(0x00, 2))
+            except (RuntimeError, pigpio.error):
+                continue
+            self._latest = data[0] / 128
+            self._timestamp = time.time()
+            self._updated.set()
+
     def _set_register(self, register, data):
         self._pi.i2c_write_byte_data(self._handle, register, data)
 
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def _floor_divide(dividend, divisor):
+    if np.any(divisor == 0):
+        raise ZeroDivisionError('integer division or modulo by zero')
+    return dividend // divisor
+
+
+def _multiply(a, b, overflow):
+    # int64 product, marks the rows of overflow whose product may leave int64,
+    # 2 ** 62 leaves a bit for the sums and left shifts following the products
+    overflow |= np.abs(np.multiply(a, b, dtype=np.float64)) >= 2.0 ** 62
+    return a * b
+
+
+def compensate_bme680(compensation, temp_adc, hum_adc, press_adc, gas_adc, gas_range):
+    # vectorized Bme680Compensation.compensate over arrays of raw values,
+    # returns arrays of temperature, humidity, pressure and gas resistance
+    c = compensation
+    temp_adc, hum_adc, press_adc, gas_adc, gas_range = np.broadcast_arrays(
+        *(np.asarray(values, dtype=np.int64) for values in (temp_adc, hum_adc, press_adc, gas_adc, gas_range)))
+    # rows of calibrations or readings out of the range of int64 arithmetic,
+    # compensated by the scalar path of arbitrary precision instead
+    overflow = np.zeros(temp_adc.shape, dtype=bool)
+
+    # temperature
+    var1 = (temp_adc >> 3) - c.t1
+    var2 = _multiply(var1, c.t2, overflow) >> 11
+    if c.t3_shift < 0:
+        raise ValueError('negative shift count')
+    if c.t3_shift < 63:
+        var3 = (_multiply(var1 >> 1, var1 >> 1, overflow) >> c.t3_shift) >> 14
+    else:
+        var3 = 0  # square is non-negative and shifted out, which numpy does not guarantee
+    t_fine = var2 + var3
+    temp_comp = (_multiply(t_fine, 5, overflow) + 128) >> 8
+
+    # humidity
+    var1 = hum_adc - c.h1 - ((_multiply(temp_comp, c.h3, overflow) // 100) >> 1)
+    square = _multiply(temp_comp, temp_comp, overflow)
+    var2 = _multiply((_multiply(temp_comp, c.h4, overflow) // 100) +
+                     ((_multiply(square, c.h5, overflow) // 100) >> 6) // 100 + 16384, c.h2, overflow) >> 10
+    var3 = _multiply(var1, var2, overflow)
+    var4 = (c.h6 + (_multiply(temp_comp, c.h7, overflow) // 100)) >> 4
+    var5 = _multiply(var3 >> 14, var3 >> 14, overflow) >> 10
+    var6 = _multiply(var4, var5, overflow) >> 1
+    hum_comp = _multiply((var3 + var6) >> 10, 1000, overflow) >> 12
+
+    # pressure
+    var1 = (t_fine >> 1) - 64000
+    square = _multiply(var1 >> 2, var1 >> 2, overflow)
+    var2 = _multiply(square >> 11, c.p6, overflow) >> 2
+    var2 = var2 + _multiply(var1, c.p5, overflow)
+    var2 = (var2 >> 2) + c.p4
+    var1 = ((_multiply(square >> 13, c.p3, overflow) >> 3) + (_multiply(var1, c.p2, overflow) >> 1))
+    var1 = var1 >> 18
+    var1 = _multiply(32768 + var1, c.p1, overflow) >> 15
+    press_comp = 1048576 - press_adc
+    press_comp = _multiply(press_comp - (var2 >> 12), 3125, overflow)
+    # a divisor of 0 only raises for rows the scalar path does not take over
+    var1 = np.where(overflow & (var1 == 0), 1, var1)
+    large = press_comp >= 0x40000000
+    press_comp = np.where(
+        large,
+        _floor_divide(press_comp, var1) << 1,
+        _floor_divide(press_comp << 1, var1))
+    var1 = _multiply(_multiply(press_comp >> 3, press_comp >> 3, overflow) >> 13, c.p9, overflow) >> 12
+    var2 = _multiply(press_comp >> 2, c.p8, overflow) >> 13
+    cube = _multiply(_multiply(press_comp >> 8, press_comp >> 8, overflow), press_comp >> 8, overflow)
+    var3 = _multiply(cube, c.p10, overflow) >> 17
+    press_comp = press_comp + ((var1 + var2 + var3 + c.p7) >> 4)
+
+    # gas resistance
+    gas_var1 = np.array(c.gas_var1, dtype=np.int64)[gas_range]
+    gas_dividend = np.array(c.gas_dividend, dtype=np.int64)[gas_range]
+    var2 = _multiply(gas_adc, 1 << 15, overflow) - 16777216 + gas_var1
+    var2 = np.where(overflow & (var2 == 0), 1, var2)
+    gas_res = _floor_divide(gas_dividend + (var2 >> 1), var2)
+
+    temperature, humidity, pressure = temp_comp / 100, hum_comp / 1000, press_comp / 100
+    for row in map(tuple, np.argwhere(overflow)):
+        temperature[row], humidity[row], pressure[row], gas_res[row] = c.compensate(
+            int(temp_adc[row]), int(hum_adc[row]), int(press_adc[row]), int(gas_adc[row]), int(gas_range[row]))
+    return temperature, humidity, pressure, gas_res
@@ -1,8 +1,143 @@
+import collections
 import ctypes
+import json
+import os
+import pigpio
 import struct
+import threading
 import time
 
 
+Bme680Calibration = collections.namedtuple('Bme680Calibration', [
+    'par_t1', 'par_t2', 'par_t3',
+    'par_p1', 'par_p2', 'par_p3', 'par_p4', 'par_p5', 'par_p6', 'par_p7', 'par_p8', 'par_p9', 'par_p10',
+    'par_h1', 'par_h2', 'par_h3', 'par_h4', 'par_h5', 'par_h6', 'par_h7',
+    'par_g1', 'par_g2', 'par_g3',
+    'res_heat_val', 'res_heat_range', 'range_switching_error',
+])
+
+
+class Bme680Compensation:
+    # integer compensation of Bosch with the constants derived from calibration precomputed
+    _GAS_CONST_ARRAY1_INT = [
+        2147483647,
+        2147483647,
+        2147483647,
+        2147483647,
+        2147483647,
+        2126008810,
+        2147483647,
+        2130303777,
+        2147483647,
+        2147483647,
+        2143188679,
+        2136746228,
+        2147483647,
+        2126008810,
+        2147483647,
+        2147483647,
+    ]
+    _GAS_CONST_ARRAY2_INT = [
+        4096000000,
+        2048000000,
+        1024000000,
+        512000000,
+        255744255,
+        127110228,
+        64000000,
+        32258064,
+        16016016,
+        8000000,
+        4000000,
+        2000000,
+        1000000,
+        500000,
+        250000,
+        125000,
+    ]
+
+    def __init__(self, calibration):
+        self.calibration = calibration
+        c = calibration
+        self.t1 = c.par_t1 << 1
+        self.t2 = c.par_t2
+        self.t3_shift = 12 * (c.par_t3 << 4)  # precedence of the reference code, 0 for large par_t3
+        self.h1 = c.par_h1 << 4
+        self.h2 = c.par_h2
+        self.h3 = c.par_h3
+        self.h4 = c.par_h4
+        self.h5 = c.par_h5
+        self.h6 = c.par_h6 << 7
+        self.h7 = c.par_h7
+        self.p1 = c.par_p1
+        self.p2 = c.par_p2
+        self.p3 = c.par_p3 << 5
+        self.p4 = c.par_p4 << 16
+        self.p5 = c.par_p5 << 1
+        self.p6 = c.par_p6
+        self.p7 = c.par_p7 << 7
+        self.p8 = c.par_p8
+        self.p9 = c.par_p9
+        self.p10 = c.par_p10
+        # var1 and the dividend term of the gas resistance for each gas range
+        self.gas_var1 = [((1340 + (5 * c.range_switching_error)) * const1) >> 16
+                         for const1 in self._GAS_CONST_ARRAY1_INT]
+        self.gas_dividend = [(const2 * var1) >> 9
+                             for const2, var1 in zip(self._GAS_CONST_ARRAY2_INT, self.gas_var1)]
+
+    def temperature(self, temp_adc):
+        # returns t_fine and temperature in 0.01 C
+        var1 = (temp_adc >> 3) - self.t1
+        var2 = (var1 * self.t2) >> 11
+        var3 = (((var1 >> 1) * (var1 >> 1)) >> self.t3_shift) >> 14
+        t_fine = var2 + var3
+        return t_fine, (t_fine * 5 + 128) >> 8
+
+    def humidity(self, hum_adc, temp_comp):
+        # humidity in 0.001 %
+        var1 = hum_adc - self.h1 - ((temp_comp * self.h3 // 100) >> 1)
+        var2 = (self.h2 * ((temp_comp * self.h4 // 100) +
+                           ((temp_comp * temp_comp * self.h5 // 100) >> 6) // 100 + 16384)) >> 10
+        var3 = var1 * var2
+        var4 = (self.h6 + (temp_comp * self.h7 // 100)) >> 4
+        var5 = ((var3 >> 14) * (var3 >> 14)) >> 10
+        var6 = (var4 * var5) >> 1
+        return (((var3 + var6) >> 10) * 1000) >> 12
+
+    def pressure(self, press_adc, t_fine):
+        # pressure in Pa
+        var1 = (t_fine >> 1) - 64000
+        var2 = ((((var1 >> 2) * (var1 >> 2)) >> 11) * self.p6) >> 2
+        var2 = var2 + (var1 * self.p5)
+        var2 = (var2 >> 2) + self.p4
+        var1 = ((((((var1 >> 2) * (var1 >> 2)) >> 13) * self.p3) >> 3) + ((self.p2 * var1) >> 1))
+        var1 = var1 >> 18
+        var1 = ((32768 + var1) * self.p1) >> 15
+        press_comp = 1048576 - press_adc
+        press_comp = (press_comp - (var2 >> 12)) * 3125
+        if press_comp >= 0x40000000:
+            press_comp = (press_comp // var1) << 1
+        else:
+            press_comp = (press_comp << 1) // var1
+        var1 = (self.p9 * (((press_comp >> 3) * (press_comp >> 3)) >> 13)) >> 12
+        var2 = ((press_comp >> 2) * self.p8) >> 13
+        var3 = ((press_comp >> 8) * (press_comp >> 8) * (press_comp >> 8) * self.p10) >> 17
+        return press_comp + ((var1 + var2 + var3 + self.p7) >> 4)
+
+    def gas(self, gas_adc, gas_range):
+        # gas resistance in Ohms
+        var2 = (gas_adc << 15) - 16777216 + self.gas_var1[gas_range]
+        return (self.gas_dividend[gas_range] + (var2 >> 1)) // var2
+
+    def compensate(self, temp_adc, hum_adc, press_adc, gas_adc, gas_range):
+        # same result as Bme680.get_data
+        t_fine, temp_comp = self.temperature(temp_adc)
+        hum_comp = self.humidity(hum_adc, temp_comp)
+        press_comp = self.pressure(press_adc, t_fine)
+        gas_res = self.gas(gas_adc, gas_range)
+        return temp_comp / 100, hum_comp / 1000, press_comp / 100, gas_res
+
+
 class Bme680:
     I2C_ADDRESS = 0x77
 
@@ -88,71 +223,28 @@ class Bme680:
         0b00001001,
     ]
 
-    _GAS_CONST_ARRAY1_INT = [
-        2147483647,
-        2147483647,
-        2147483647,
-        2147483647,
-        2147483647,
-        2126008810,
-        2147483647,
-        2130303777,
-        2147483647,
-        2147483647,
-        2143188679,
-        2136746228,
-        2147483647,
-        2126008810,
-        2147483647,
-        2147483647,
-    ]
-    _GAS_CONST_ARRAY2_INT = [
-        4096000000,
-        2048000000,
-        1024000000,
-        512000000,
-        255744255,
-        127110228,
-        64000000,
-        32258064,
-        16016016,
-        8000000,
-        4000000,
-        2000000,
-        1000000,
-        500000,
-        250000,
-        125000,
-    ]
+    _GAS_PROFILE_RETRY_INTERVAL = 0.002
+    _GAS_PROFILE_RETRY_MAX = 50
+
+    _SELF_CLEARING_MASKS = {0x74: _MODE_MASK}  # forced mode returns to sleep after measurement
 
-    def __init__(self, pi, bus):
+    def __init__(self, pi, bus, calibration_cache=None, verify_shadow=False):
         self._pi = pi
         self._bus = bus
+        self._calibration_cache = calibration_cache  # path of JSON file of calibration per chip
+        self._verify_shadow = verify_shadow  # read registers back even if known, and compare
         self._handle = None  # I2C handle
-        self._par_t1 = None
-        self._par_t2 = None
-        self._par_t3 = None
-        self._par_p1 = None
-        self._par_p2 = None
-        self._par_p3 = None
-        self._par_p4 = None
-        self._par_p5 = None
-        self._par_p6 = None
-        self._par_p7 = None
-        self._par_p8 = None
-        self._par_p9 = None
-        self._par_p10 = None
-        self._par_h1 = None
-        self._par_h2 = None
-        self._par_h3 = None
-        self._par_h4 = None
-        self._par_h5 = None
-        self._par_h6 = None
-        self._par_h7 = None
-        self._par_g1 = None
-        self._par_g2 = None
-        self._par_g3 = None
+        self._calibration = None  # Bme680Calibration
+        self._compensation = None  # Bme680Compensation
         self._duration_secs = None
+        self._tph_duration_secs = None  # measurement duration without heating
+        self._nb_conv = None  # heater slot of apply_config
+        self._heater = None  # (res_heat, gas_wait) registers of apply_config
+        self._heater_profile = []  # (res_heat, gas_wait) registers of each heater profile step
+        self._heater_durations = []  # measurement duration of each heater profile step
+        self._shadow = {}  # register: known content
+        self._saved_transactions = 0  # reads skipped by the shadow
+        self._shadow_mismatches = 0  # shadow differed from register in verify mode
 
     def __enter__(self):
         self.start()
@@ -169,7 +261,11 @@ class Bme680:
         try:
             self._set_register(0xe0, 0xb6)
             time.sleep(0.01)
-            self._assign_calibration_parameter()
+            self.refresh_shadow()
+            if self._calibration_cache is None:
+                self._assign_calibration_parameter()
+            else:
+                self._assign_cached_calibration_parameter()
         except:
             self.stop()
             raise
@@ -179,19 +275,80 @@ class Bme680:
             self._pi.i2c_close(self._handle)
             self._handle = None
 
+    @property
+    def saved_transactions(self):
+        return self._saved_transactions
+
+    @property
+    def shadow_mismatches(self):
+        return self._shadow_mismatches
+
+    def refresh_shadow(self):
+        # forget known registers, they are read again at the next masked write
+        self._shadow.clear()
+
+    @property
+    def calibration(self):
+        return self._calibration
+
+    @property
+    def compensation(self):
+        return self._compensation
+
     def _assign_calibration_parameter(self):
         data = self._get_registers(0x8a, 23)
-        self._par_t2, self._par_t3, self._par_p1, self._par_p2, self._par_p3, self._par_p4, \
-            self._par_p5, self._par_p7, self._par_p6, self._par_p8, self._par_p9, self._par_p10 \
+        par_t2, par_t3, par_p1, par_p2, par_p3, par_p4, par_p5, par_p7, par_p6, par_p8, par_p9, par_p10 \
             = struct.unpack('<hbxHhbxhhbbxxhhB', data)
         data = self._get_registers(0xe1, 14)
-        self._par_h3, self._par_h4, self._par_h5, self._par_h6, self._par_h7, self._par_t1, \
-            self._par_g2, self._par_g1, self._par_g3 = struct.unpack('<bbbBbHhbb', data[3:])
-        self._par_h2 = (data[0] << 4) ^ (data[1] >> 4)
-        self._par_h1 = (data[2] << 4) ^ (data[1] & 0xf)
-        self._res_heat_val = self._get_register(0x00)
-        self._res_heat_range = (self._get_register(0x02) & 0b00110000) >> 4
-        self._range_switching_error = ctypes.c_byte(self._get_register(0x04)).value >> 4
+        par_h3, par_h4, par_h5, par_h6, par_h7, par_t1, par_g2, par_g1, par_g3 \
+            = struct.unpack('<bbbBbHhbb', data[3:])
+        par_h2 = (data[0] << 4) ^ (data[1] >> 4)
+        par_h1 = (data[2] << 4) ^ (data[1] & 0xf)
+        res_heat_val = self._get_register(0x00)
+        res_heat_range = (self._get_register(0x02) & 0b00110000) >> 4
+        range_switching_error = ctypes.c_byte(self._get_register(0x04)).value >> 4
+        self._set_calibration(Bme680Calibration(
+            par_t1, par_t2, par_t3,
+            par_p1, par_p2, par_p3, par_p4, par_p5, par_p6, par_p7, par_p8, par_p9, par_p10,
+            par_h1, par_h2, par_h3, par_h4, par_h5, par_h6, par_h7,
+            par_g1, par_g2, par_g3,
+            res_heat_val, res_heat_range, range_switching_error))
+
+    def _assign_cached_calibration_parameter(self):
+        # par_t1 differs between chips, so it tells whether the cached calibration is of this chip
+        fingerprint = list(self._get_registers(0xe9, 2))
+        key = f'{self._bus}:{self.I2C_ADDRESS:#04x}'
+        try:
+            with open(self._calibration_cache) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        if not isinstance(cache, dict):
+            cache = {}
+        entry = cache.get(key)
+        if isinstance(entry, dict) and entry.get('fingerprint') == fingerprint:
+            try:
+                self._set_calibration(Bme680Calibration(*entry['calibration']))
+                return
+            except (KeyError, TypeError):
+                pass
+        self._assign_calibration_parameter()
+        cache[key] = {'fingerprint': fingerprint, 'calibration': list(self._calibration)}
+        tmp_path = f'{self._calibration_cache}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self._calibration_cache)
+        except OSError:
+            # the cache is optional, the calibration just read is used
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _set_calibration(self, calibration):
+        self._calibration = calibration
+        self._compensation = Bme680Compensation(calibration)
 
     def apply_config(self, osrs_t, osrs_h, osrs_p, iir_filter, nb_conv, gas_wait, heat_temp, amb_temp):
         ctrl_gas1 = 0
@@ -231,121 +388,185 @@ class Bme680:
         self._set_registers(0x71, [ctrl_gas1, ctrl_hum], [ctrl_gas1_mask, ctrl_hum_mask])
         self._set_registers(0x74, [ctrl_meas, config], [ctrl_meas_mask, config_mask])
 
+        self._tph_duration_secs = duration_ns / 1000000
+        self._nb_conv = nb_conv
+        self._heater = (self._calc_res_heat(heat_temp, amb_temp), self._encode_gas_wait(gas_wait))
+        self._set_register(0x64 + nb_conv, self._heater[1])
+        self._set_register(0x5a + nb_conv, self._heater[0])
         duration_ns += gas_wait * 1000
+
+        self._duration_secs = duration_ns / 1000000
+
+    def apply_heater_profile(self, profile, amb_temp):
+        # programs heater steps of (heat_temp, gas_wait) to the slots from 0,
+        # apply_config has to be called before for oversampling
+        if self._nb_conv is None:
+            raise RuntimeError('Bme680 apply_config has to be called before apply_heater_profile')
+        if not 0 < len(profile) <= len(self._NB_CONV_LIST):
+            raise ValueError(f'Heater profile has 1 to {len(self._NB_CONV_LIST)} steps: {len(profile)}')
+        self._heater_profile = [(self._calc_res_heat(heat_temp, amb_temp), self._encode_gas_wait(gas_wait))
+                                for heat_temp, gas_wait in profile]
+        self._heater_durations = [self._tph_duration_secs + gas_wait / 1000 for _, gas_wait in profile]
+        # the slot of apply_config keeps its heater for get_data until get_gas_profile
+        self._set_heaters([(step, *heater) for step, heater in enumerate(self._heater_profile)
+                           if step != self._nb_conv])
+
+    def get_gas_profile(self):
+        # gas resistances measured at each step of the heater profile
+        try:
+            # programs the slot of apply_config and any slot changed since apply_heater_profile
+            self._set_heaters([(step, *heater) for step, heater in enumerate(self._heater_profile)])
+            return self._measure_gas_profile()
+        finally:
+            # back to the heater and the slot of apply_config
+            if self._nb_conv < len(self._heater_profile):
+                self._set_heaters([(self._nb_conv, *self._heater)])
+            self._set_register(0x71, self._NB_CONV_LIST[self._nb_conv], self._NB_CONV_MASK)
+
+    def _measure_gas_profile(self):
+        gas_resistances = []
+        for step, duration_secs in enumerate(self._heater_durations):
+            ctrl_gas1 = self._get_shadow_registers(0x71, 1)[0]
+            ctrl_gas1 = (ctrl_gas1 & (~self._NB_CONV_MASK)) ^ self._NB_CONV_LIST[step]
+            ctrl_meas = self._get_shadow_registers(0x74, 1)[0]
+            ctrl_meas = (ctrl_meas & (~self._MODE_MASK)) ^ self.MODE_FORCED
+            # selects the step and starts measurement in one transaction
+            self._pi.i2c_write_device(self._handle, [0x71, ctrl_gas1, 0x74, ctrl_meas])
+            self._store_shadow(0x71, [ctrl_gas1])
+            self._store_shadow(0x74, [ctrl_meas])
+            time.sleep(duration_secs)
+            for _ in range(self._GAS_PROFILE_RETRY_MAX):
+                raw_data = self.collect()
+                if raw_data is not None:
+                    break
+                time.sleep(self._GAS_PROFILE_RETRY_INTERVAL)
+            else:
+                raise RuntimeError('Failed to read')
+            _, _, _, gas_adc, gas_range = raw_data
+            gas_resistances.append(self._compensation.gas(gas_adc, gas_range))
+        return gas_resistances
+
+    def _set_heaters(self, heaters):
+        # (slot, res_heat, gas_wait) to res_heat_x at 0x5a and gas_wait_x at 0x64 in one transaction,
+        # registers known to hold the value are skipped
+        data = []
+        for slot, res_heat, gas_wait in heaters:
+            for register, data_item in ((0x5a + slot, res_heat), (0x64 + slot, gas_wait)):
+                if self._shadow.get(register) != data_item:
+                    data.append(register)
+                    data.append(data_item)
+        if not data:
+            return
+        self._pi.i2c_write_device(self._handle, data)
+        for i in range(0, len(data), 2):
+            self._store_shadow(data[i], [data[i + 1]])
+
+    @staticmethod
+    def _encode_gas_wait(gas_wait):
         if gas_wait > 1008:
-            gas_wait = 0b11000000 ^ (gas_wait >> 6)
+            return 0b11000000 ^ (gas_wait >> 6)
         elif gas_wait > 252:
-            gas_wait = 0b10000000 ^ (gas_wait >> 4)
+            return 0b10000000 ^ (gas_wait >> 4)
         elif gas_wait > 63:
-            gas_wait = 0b01000000 ^ (gas_wait >> 2)
-        self._set_register(0x64 + nb_conv, gas_wait)
-
-        var1 = (amb_temp * self._par_g3 // 1000) << 8
-        var2 = (self._par_g1 + 784) * \
-            (((self._par_g2 + 154009) * heat_temp * 5 // 100 + 3276800) // 10)
+            return 0b01000000 ^ (gas_wait >> 2)
+        return gas_wait
+
+    def _calc_res_heat(self, heat_temp, amb_temp):
+        calibration = self._calibration
+        var1 = (amb_temp * calibration.par_g3 // 1000) << 8
+        var2 = (calibration.par_g1 + 784) * \
+            (((calibration.par_g2 + 154009) * heat_temp * 5 // 100 + 3276800) // 10)
         var3 = var1 + (var2 >> 1)
-        var4 = var3 // (self._res_heat_range + 4)
-        var5 = 131 * self._res_heat_val + 65536
+        var4 = var3 // (calibration.res_heat_range + 4)
+        var5 = 131 * calibration.res_heat_val + 65536
         res_heat_x100 = ((var4 // var5 - 250) * 34)
-        res_heat = (res_heat_x100 + 50) // 100
-        self._set_register(0x5a + nb_conv, res_heat)
-
-        self._duration_secs = duration_ns / 1000000
+        return (res_heat_x100 + 50) // 100
 
     def set_mode(self, mode):
         self._set_register(0x74, mode, self._MODE_MASK)
 
-    def get_data(self):
+    def trigger(self):
+        # starts a forced measurement, returns the time.monotonic() when it completes
         self.set_mode(self.MODE_FORCED)
+        return time.monotonic() + self._duration_secs
+
+    def collect(self):
+        # (temp_adc, hum_adc, press_adc, gas_adc, gas_range) of the triggered measurement,
+        # or None if it is not completed yet
+        meas_status_0, _, press_msb, press_lsb, press_xlsb, temp_msb, temp_lsb, temp_xlsb, \
+            hum_msb, hum_lsb, _, _, _, gas_msb, gas_lsb = self._get_registers(0x1d, 15)
+
+        if (meas_status_0 & 0b10000000) == 0:
+            # if not new data
+            return None
+        if (gas_lsb & 0b00110000) == 0:
+            # gas is unavailable
+            return None
+
+        temp_adc = (temp_msb << 12) ^ (temp_lsb << 4) ^ (temp_xlsb >> 4)
+        hum_adc = (hum_msb << 8) ^ hum_lsb
+        press_adc = (press_msb << 12) ^ (press_lsb << 4) ^ (press_xlsb >> 4)
+        gas_adc = (gas_msb << 2) ^ (gas_lsb >> 6)
+        gas_range = gas_lsb & 0b1111
+        return temp_adc, hum_adc, press_adc, gas_adc, gas_range
+
+    def get_raw_data(self):
+        # (temp_adc, hum_adc, press_adc, gas_adc, gas_range) to be compensated later
+        self.trigger()
         time.sleep(self._duration_secs)
 
         for _ in range(10):
-            meas_status_0, _, press_msb, press_lsb, press_xlsb, temp_msb, temp_lsb, temp_xlsb, \
-                hum_msb, hum_lsb, _, _, _, gas_msb, gas_lsb = self._get_registers(0x1d, 15)
-
-            if (meas_status_0 & 0b10000000) == 0:
-                # if not new data
-                time.sleep(0.01)
-                continue
-            if (gas_lsb & 0b00110000) == 0:
-                # gas is unavailable
-                time.sleep(0.01)
-                continue
-
-            temp_adc = (temp_msb << 12) ^ (temp_lsb << 4) ^ (temp_xlsb >> 4)
-            var1 = (temp_adc >> 3) - (self._par_t1 << 1)
-            var2 = (var1 * self._par_t2) >> 11
-            var3 = (((var1 >> 1) * (var1 >> 1)) >> 12 * (self._par_t3 << 4)) >> 14
-            t_fine = var2 + var3
-            temp_comp = (t_fine * 5 + 128) >> 8
-
-            hum_adc = (hum_msb << 8) ^ hum_lsb
-            temp_scaled = temp_comp
-            var1 = hum_adc - (self._par_h1 << 4) - ((temp_scaled * self._par_h3 // 100) >> 1)
-            var2 = (self._par_h2 * ((temp_scaled * self._par_h4 // 100) +
-                                    ((temp_scaled * temp_scaled * self._par_h5 // 100) >> 6) //
-                                    100 + 16384)) >> 10
-            var3 = var1 * var2
-            var4 = ((self._par_h6 << 7) + (temp_scaled * self._par_h7 // 100)) >> 4
-            var5 = ((var3 >> 14) * (var3 >> 14)) >> 10
-            var6 = (var4 * var5) >> 1
-            hum_comp = (((var3 + var6) >> 10) * 1000) >> 12
-
-            press_adc = (press_msb << 12) ^ (press_lsb << 4) ^ (press_xlsb >> 4)
-            var1 = (t_fine >> 1) - 64000
-            var2 = ((((var1 >> 2) * (var1 >> 2)) >> 11) * self._par_p6) >> 2
-            var2 = var2 + ((var1 * self._par_p5) << 1)
-            var2 = (var2 >> 2) + (self._par_p4 << 16)
-            var1 = (((((var1 >> 2) * (var1 >> 2)) >> 13) *
-                     ((self._par_p3 << 5)) >> 3) + ((self._par_p2 * var1) >> 1))
-            var1 = var1 >> 18
-            var1 = ((32768 + var1) * self._par_p1) >> 15
-            press_comp = 1048576 - press_adc
-            press_comp = (press_comp - (var2 >> 12)) * 3125
-            if press_comp >= 0x40000000:
-                press_comp = (press_comp // var1) << 1
-            else:
-                press_comp = (press_comp << 1) // var1
-            var1 = (self._par_p9 * (((press_comp >> 3) * (press_comp >> 3)) >> 13)) >> 12
-            var2 = ((press_comp >> 2) * self._par_p8) >> 13
-            var3 = ((press_comp >> 8) * (press_comp >> 8) * (press_comp >> 8) * self._par_p10) >> 17
-            press_comp = press_comp + ((var1 + var2 + var3 + (self._par_p7 << 7)) >> 4)
-
-            gas_adc = (gas_msb << 2) ^ (gas_lsb >> 6)
-            gas_range = gas_lsb & 0b1111
-            var1 = ((1340 + (5 * self._range_switching_error)) *
-                    (self._GAS_CONST_ARRAY1_INT[gas_range])) >> 16
-            var2 = (gas_adc << 15) - 16777216 + var1
-            gas_res = (((self._GAS_CONST_ARRAY2_INT[gas_range] * var1) >> 9) + (var2 >> 1)) // var2
-
-            return temp_comp / 100, hum_comp / 1000, press_comp / 100, gas_res
+            raw_data = self.collect()
+            if raw_data is not None:
+                return raw_data
+            time.sleep(0.01)
 
         raise RuntimeError('Failed to read')
 
+    def get_data(self):
+        return self._compensation.compensate(*self.get_raw_data())
+
     def _set_register(self, register, data, mask=None):
-        if mask is None:
-            self._pi.i2c_write_byte_data(self._handle, register, data)
-            return
-        base_data = self._get_register(register)
-        new_data = (base_data & (~mask)) ^ data
-        self._pi.i2c_write_byte_data(self._handle, register, new_data)
+        if mask is not None:
+            base_data = self._get_shadow_registers(register, 1)[0]
+            data = (base_data & (~mask)) ^ data
+        self._pi.i2c_write_byte_data(self._handle, register, data)
+        self._store_shadow(register, [data])
 
     def _set_registers(self, register, data, mask=None):
-        if mask is None:
-            new_data = []
-            for data_item in data:
-                new_data.append(register)
-                new_data.append(data_item)
-                register += 1
-            self._pi.i2c_write_device(self._handle, new_data)
-            return
-        base_data = self._get_registers(register, len(data))
+        if mask is not None:
+            base_data = self._get_shadow_registers(register, len(data))
+            data = [(base_item & (~mask_item)) ^ data_item
+                    for base_item, data_item, mask_item in zip(base_data, data, mask)]
         new_data = []
-        for base_item, data_item, mask_item in zip(base_data, data, mask):
-            new_data.append(register)
-            new_data.append((base_item & (~mask_item)) ^ data_item)
-            register += 1
+        for offset, data_item in enumerate(data):
+            new_data.append(register + offset)
+            new_data.append(data_item)
         self._pi.i2c_write_device(self._handle, new_data)
+        self._store_shadow(register, data)
+
+    def _get_shadow_registers(self, register, length):
+        shadow = [self._shadow.get(register + offset) for offset in range(length)]
+        if None not in shadow and not self._verify_shadow:
+            self._saved_transactions += 1
+            return shadow
+        if length == 1:
+            data = [self._get_register(register)]
+        else:
+            data = list(self._get_registers(register, length))
+        if self._verify_shadow:
+            for offset, (shadow_item, data_item) in enumerate(zip(shadow, data)):
+                if shadow_item is None:
+                    continue
+                mask = ~self._SELF_CLEARING_MASKS.get(register + offset, 0)
+                if (shadow_item & mask) != (data_item & mask):
+                    self._shadow_mismatches += 1
+        self._store_shadow(register, data)
+        return data
+
+    def _store_shadow(self, register, data):
+        for offset, data_item in enumerate(data):
+            self._shadow[register + offset] = data_item & ~self._SELF_CLEARING_MASKS.get(register + offset, 0)
 
     def _get_register(self, register):
         return self._pi.i2c_read_byte_data(self._handle, register)
@@ -356,3 +577,92 @@ class Bme680:
         if read != length:
             raise RuntimeError(f"Failed to read: {read}")
         return data
+
+
+Bme680Sample = collections.namedtuple('Bme680Sample', [
+    'timestamp', 'temperature', 'humidity', 'pressure', 'gas_resistance'])
+
+
+class Bme680Sampler:
+    _RETRY_INTERVAL = 0.002  # polling interval after the predicted completion
+    _RETRY_MAX = 50
+
+    def __init__(self, bme680, interval=1.0):
+        self._bme680 = bme680
+        self._interval = interval  # seconds between triggers
+        self._thread = None
+        self._stopped = threading.Event()
+        self._latest = None  # Bme680Sample
+        self._missed = 0  # intervals without a sample
+        self._late = 0  # samples not completed at the predicted time
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def latest(self):
+        return self._latest
+
+    @property
+    def missed(self):
+        return self._missed
+
+    @property
+    def late(self):
+        return self._late
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError('Bme680Sampler already started')
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                raw_data = self._sample()
+            except (RuntimeError, pigpio.error):
+                raw_data = None
+            if self._stopped.is_set():
+                return
+            if raw_data is None:
+                self._missed += 1
+            else:
+                temperature, humidity, pressure, gas_resistance = \
+                    self._bme680.compensation.compensate(*raw_data)
+                self._latest = Bme680Sample(time.time(), temperature, humidity, pressure, gas_resistance)
+
+            next_time += self._interval
+            now = time.monotonic()
+            if next_time < now:
+                # measurement took longer than the interval
+                skipped = int((now - next_time) // self._interval) + 1
+                self._missed += skipped
+                next_time += skipped * self._interval
+            self._stopped.wait(next_time - now)
+
+    def _sample(self):
+        ready_time = self._bme680.trigger()
+        if self._stopped.wait(max(0, ready_time - time.monotonic())):
+            return None
+        for retry in range(self._RETRY_MAX):
+            raw_data = self._bme680.collect()
+            if raw_data is not None:
+                if retry:
+                    self._late += 1
+                return raw_data
+            if self._stopped.wait(self._RETRY_INTERVAL):
+                return None
+        return None
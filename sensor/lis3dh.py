@@ -1,7 +1,69 @@
+import array
+import pigpio
 import struct
+import sys
+import threading
 import time
 
 
+class Lis3dhBuffer:
+    # ring buffer of (x, y, z) samples and their timestamps backed by preallocated arrays
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._samples = array.array('h', bytes(capacity * 6))  # x, y, z interleaved
+        self._sample_bytes = memoryview(self._samples).cast('B')
+        self._timestamps = array.array('d', bytes(capacity * 8))
+        self._written = 0  # samples written since start
+        self._read = 0  # samples read since start
+        self._dropped = 0  # samples overwritten before read
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._written - self._read
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def append(self, data, first_timestamp, period):
+        # data is little endian x, y, z of samples, timestamps are spaced by period
+        count = len(data) // 6
+        if sys.byteorder != 'little':
+            values = array.array('h', data)
+            values.byteswap()
+            data = values.tobytes()
+        with self._lock:
+            pos = self._written % self._capacity
+            first = min(count, self._capacity - pos)
+            self._sample_bytes[pos * 6:(pos + first) * 6] = data[:first * 6]
+            self._sample_bytes[:(count - first) * 6] = data[first * 6:count * 6]
+            for i in range(count):
+                self._timestamps[(pos + i) % self._capacity] = first_timestamp + i * period
+            self._written += count
+            overwritten = self._written - self._read - self._capacity
+            if overwritten > 0:
+                self._dropped += overwritten
+                self._read += overwritten
+
+    def read(self, count=None):
+        # returns timestamps and x, y, z interleaved samples as arrays
+        with self._lock:
+            available = self._written - self._read
+            if count is None or count > available:
+                count = available
+            pos = self._read % self._capacity
+            first = min(count, self._capacity - pos)
+            timestamps = self._timestamps[pos:pos + first] + self._timestamps[:count - first]
+            samples = self._samples[pos * 3:(pos + first) * 3] + self._samples[:(count - first) * 3]
+            self._read += count
+        return timestamps, samples
+
+
 class Lis3dh:
     I2C_ADDRESS = 0x19
 
@@ -18,11 +80,46 @@ class Lis3dh:
     DATA_RATE_1600HZ_LOW = 0b10000000
     DATA_RATE_1250HZ_HIGH = 0b10010000
     DATA_RATE_5000HZ_LOW = 0b10010000
+    _DATA_RATE_HZ = {
+        DATA_RATE_POWER_DOWN: 0,
+        DATA_RATE_1HZ: 1,
+        DATA_RATE_10HZ: 10,
+        DATA_RATE_25HZ: 25,
+        DATA_RATE_50HZ: 50,
+        DATA_RATE_100HZ: 100,
+        DATA_RATE_200HZ: 200,
+        DATA_RATE_400HZ: 400,
+        DATA_RATE_1600HZ_LOW: 1600,
+        DATA_RATE_1250HZ_HIGH: 1344,
+    }
+    _DATA_RATE_5000HZ_LOW_HZ = 5376
+
+    _FIFO_SIZE = 32
+    _FIFO_EN = 0b01000000  # CTRL_REG5
+    _FIFO_MODE_BYPASS = 0b00000000  # FIFO_CTRL_REG
+    _FIFO_MODE_STREAM = 0b10000000
+    _FIFO_SRC_OVRN = 0b01000000
+    _FIFO_SRC_FSS_MASK = 0b00011111
+    _FIFO_WATERMARK = 16  # FTH of FIFO_CTRL_REG, INT1 rises above this level
+    _CTRL_REG3_I1_ZYXDA = 0b00010000
+    _CTRL_REG3_I1_WTM = 0b00000100
 
-    def __init__(self, pi, bus):
+    def __init__(self, pi, bus, int1_gpio=None):
         self._pi = pi
         self._bus = bus
+        self._int1_gpio = int1_gpio  # GPIO pin number connected to INT1, or None to poll
         self._handle = None  # I2C handle
+        self._cb = None  # for cancel callback of INT1
+        self._data_ready = threading.Event()  # INT1 rose for data ready
+        self._data_rate_hz = 0
+        self._fifo_buffer = None  # Lis3dhBuffer of FIFO stream mode
+        self._fifo_reader = None  # thread draining FIFO
+        self._fifo_streaming = False
+        self._fifo_overruns = 0  # FIFO was full and samples were lost before drained
+        self._fifo_transactions = 0  # I2C transactions to drain FIFO
+        self._fifo_samples = 0  # samples drained from FIFO
+        self._fifo_interrupt = False  # FIFO is drained by INT1 of watermark
+        self._fifo_lock = threading.Lock()  # for draining in callback while stopping
 
     def __enter__(self):
         self.start()
@@ -35,25 +132,175 @@ class Lis3dh:
         if self._handle is not None:
             raise RuntimeError('Bme680 already started')
         self._handle = self._pi.i2c_open(self._bus, self.I2C_ADDRESS)
+        if self._int1_gpio is None:
+            return
+        try:
+            self._set_register(0x22, self._CTRL_REG3_I1_ZYXDA)
+            # first read does not wait for unread data which may not raise INT1 again
+            self._data_ready.set()
+            self._pi.set_mode(self._int1_gpio, pigpio.INPUT)
+            self._cb = self._pi.callback(self._int1_gpio, pigpio.RISING_EDGE, self._on_int1)
+        except:
+            self.stop()
+            raise
 
     def stop(self):
+        self.stop_fifo()
+        if self._cb is not None:
+            self._cb.cancel()
+            self._cb = None
+            self._set_register(0x22, 0)
         if self._handle is not None:
             self._pi.i2c_close(self._handle)
             self._handle = None
 
     def apply_config(self, data_rate, power_mode):
         self._set_register(0x20, data_rate | power_mode | 0b111)
+        if data_rate == self.DATA_RATE_5000HZ_LOW and power_mode == self.POWER_MODE_LOW:
+            self._data_rate_hz = self._DATA_RATE_5000HZ_LOW_HZ
+        else:
+            self._data_rate_hz = self._DATA_RATE_HZ[data_rate]
+
+    @property
+    def fifo_buffer(self):
+        return self._fifo_buffer
+
+    @property
+    def fifo_overruns(self):
+        return self._fifo_overruns
+
+    @property
+    def fifo_transactions(self):
+        return self._fifo_transactions
+
+    @property
+    def fifo_samples(self):
+        return self._fifo_samples
+
+    def start_fifo(self, capacity=4096):
+        # streams samples through 32 level FIFO into a buffer of capacity samples,
+        # apply_config has to be called before for data rate
+        if self._fifo_buffer is not None:
+            raise RuntimeError('Lis3dh FIFO already started')
+        if self._data_rate_hz == 0:
+            raise RuntimeError('Lis3dh data rate is not configured')
+        if capacity < self._FIFO_SIZE:
+            raise ValueError(f'Capacity is less than FIFO size: {capacity}')
+        self._fifo_buffer = Lis3dhBuffer(capacity)
+        # bypass mode empties FIFO before stream mode
+        self._set_register(0x2e, self._FIFO_MODE_BYPASS)
+        self._set_register(0x24, self._FIFO_EN)
+        if self._cb is not None:
+            self._fifo_interrupt = True
+            self._set_register(0x22, self._CTRL_REG3_I1_WTM)
+            self._set_register(0x2e, self._FIFO_MODE_STREAM | self._FIFO_WATERMARK)
+            return
+        self._set_register(0x2e, self._FIFO_MODE_STREAM)
+        self._fifo_streaming = True
+        self._fifo_reader = threading.Thread(target=self._read_fifo_loop, daemon=True)
+        self._fifo_reader.start()
+
+    def stop_fifo(self):
+        if self._fifo_reader is not None:
+            self._fifo_streaming = False
+            self._fifo_reader.join()
+            self._fifo_reader = None
+        with self._fifo_lock:
+            if self._fifo_interrupt:
+                self._fifo_interrupt = False
+                self._set_register(0x22, self._CTRL_REG3_I1_ZYXDA)
+            if self._fifo_buffer is not None:
+                self._fifo_buffer = None
+                self._set_register(0x2e, self._FIFO_MODE_BYPASS)
+                self._set_register(0x24, 0)
+
+    def read_fifo(self):
+        # drains FIFO into the buffer, returns the number of samples
+        fifo_src = self._get_register(0x2f)
+        self._fifo_transactions += 1
+        if fifo_src & self._FIFO_SRC_OVRN:
+            self._fifo_overruns += 1
+            count = self._FIFO_SIZE
+        else:
+            count = fifo_src & self._FIFO_SRC_FSS_MASK
+        if count == 0:
+            return 0
+        return self._drain_fifo(count)
+
+    def _drain_fifo(self, count):
+        timestamp = time.time()
+        # one combined transaction reads all samples beyond 32 bytes of block read
+        read, data = self._pi.i2c_zip(self._handle, [2, 7, 1, 0xa8, 6, count * 6, 3, 0])
+        self._fifo_transactions += 1
+        if read != count * 6:
+            raise RuntimeError(f"Failed to read: {read}")
+        period = 1 / self._data_rate_hz
+        # the last sample is the newest one
+        self._fifo_buffer.append(data, timestamp - (count - 1) * period, period)
+        self._fifo_samples += count
+        return count
+
+    def _drain_fifo_watermark(self, timestamp):
+        # FIFO holds more samples than the watermark, so FIFO_SRC_REG and the samples are read at once
+        count = self._FIFO_WATERMARK
+        read, data = self._pi.i2c_zip(
+            self._handle, [2, 7, 1, 0x2f, 6, 1, 7, 1, 0xa8, 6, count * 6, 3, 0])
+        self._fifo_transactions += 1
+        if read != 1 + count * 6:
+            raise RuntimeError(f"Failed to read: {read}")
+        if data[0] & self._FIFO_SRC_OVRN:
+            self._fifo_overruns += 1
+        period = 1 / self._data_rate_hz
+        # the sample next to the drained ones raised INT1 at timestamp
+        self._fifo_buffer.append(data[1:], timestamp - count * period, period)
+        self._fifo_samples += count
+
+    def _on_int1(self, gpio, level, tick):
+        if not self._fifo_interrupt:
+            self._data_ready.set()
+            return
+        timestamp = time.time()
+        with self._fifo_lock:
+            # INT1 does not rise again while FIFO stays above the watermark
+            while self._fifo_interrupt and self._pi.read(gpio):
+                self._drain_fifo_watermark(timestamp)
+                timestamp = time.time()
+
+    def _read_fifo_loop(self):
+        # drains when FIFO is about half full
+        interval = self._FIFO_SIZE / 2 / self._data_rate_hz
+        next_time = time.monotonic()
+        while self._fifo_streaming:
+            self.read_fifo()
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
 
     def get_data(self):
         for _ in range(10):
-            base_data = self._get_registers(0xa7, 7)
-            status_reg, *data = struct.unpack('<Bhhh', base_data)
-            if (status_reg & 0b00001000) == 0:
-                time.sleep(0.01)
+            if self._cb is not None:
+                # INT1 rises when new data is ready
+                self._data_ready.wait(max(0.01, 2 / self._data_rate_hz) if self._data_rate_hz else 1)
+                self._data_ready.clear()
+            data = self.collect()
+            if data is None:
+                if self._cb is None:
+                    time.sleep(0.01)
                 continue
             return data
         raise RuntimeError('Failed to read')
 
+    def collect(self):
+        # x, y and z of new data, or None if it is not ready
+        base_data = self._get_registers(0xa7, 7)
+        status_reg, *data = struct.unpack('<Bhhh', base_data)
+        if (status_reg & 0b00001000) == 0:
+            return None
+        return data
+
     def _set_register(self, register, data):
         self._pi.i2c_write_byte_data(self._handle, register, data)
 
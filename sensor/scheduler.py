@@ -0,0 +1,190 @@
+import collections
+import heapq
+import itertools
+import pigpio
+import threading
+import time
+
+SensorReading = collections.namedtuple('SensorReading', ['timestamp', 'value'])
+SensorSnapshot = collections.namedtuple('SensorSnapshot', ['timestamp', 'readings'])
+
+
+class _Job:
+    def __init__(self, name, interval, trigger, collect):
+        self.name = name
+        self.interval = interval  # seconds between triggers
+        self.trigger = trigger  # starts measurement and returns time.monotonic() to collect, or None
+        self.collect = collect  # returns value, or None if measurement is not completed yet
+        self.next_time = 0  # time.monotonic() of the next trigger
+        self.token = 0  # queued entry which is not stale
+        self.measuring = False  # triggered and not collected yet
+        self.retry = 0
+        self.finished = 0  # time.time() when the last measurement succeeded or failed
+        self.missed = 0  # measurements failed
+        self.late = 0  # measurements not completed at the predicted time
+
+
+class SensorScheduler:
+    # samples sensors at their own intervals in one thread, so I2C accesses never overlap
+    # while conversions of sensors overlap
+
+    _TRIGGER = 0
+    _COLLECT = 1
+    _RETRY_INTERVAL = 0.002
+    _RETRY_MAX = 100
+
+    def __init__(self):
+        self._jobs = {}  # name: _Job
+        self._queue = []  # heap of (time.monotonic(), seq, name, token, stage)
+        self._seq = itertools.count()
+        self._readings = {}  # name: SensorReading
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def add(self, name, interval, collect, trigger=None):
+        with self._condition:
+            if name in self._jobs:
+                raise ValueError(f'Sensor already added: {name}')
+            job = _Job(name, interval, trigger, collect)
+            self._jobs[name] = job
+            self._push(time.monotonic(), job, self._TRIGGER)
+            self._condition.notify()
+
+    def add_bme680(self, bme680, interval, name='bme680'):
+        # value is (temperature, humidity, pressure, gas resistance)
+        def collect():
+            raw_data = bme680.collect()
+            if raw_data is None:
+                return None
+            return bme680.compensation.compensate(*raw_data)
+        self.add(name, interval, collect, bme680.trigger)
+
+    def add_adt7410(self, adt7410, interval, name='adt7410'):
+        self.add(name, interval, adt7410.collect, adt7410.trigger)
+
+    def add_lis3dh(self, lis3dh, interval, name='lis3dh'):
+        self.add(name, interval, lis3dh.collect)
+
+    def missed(self, name):
+        return self._jobs[name].missed
+
+    def late(self, name):
+        return self._jobs[name].late
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError('SensorScheduler already started')
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            with self._condition:
+                self._running = False
+                self._condition.notify_all()
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self):
+        # latest readings without waiting
+        with self._condition:
+            return SensorSnapshot(time.time(), dict(self._readings))
+
+    def read(self, timeout=None):
+        # triggers idle sensors at once and waits until every sensor finishes a measurement
+        with self._condition:
+            start = time.time()
+            now = time.monotonic()
+            for job in self._jobs.values():
+                if not job.measuring:
+                    self._push(now, job, self._TRIGGER)
+            self._condition.notify_all()
+            self._condition.wait_for(
+                lambda: all(job.finished >= start for job in self._jobs.values()), timeout)
+            return SensorSnapshot(time.time(), dict(self._readings))
+
+    def _push(self, when, job, stage):
+        job.token += 1
+        heapq.heappush(self._queue, (when, next(self._seq), job.name, job.token, stage))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._running:
+                        return
+                    if not self._queue:
+                        self._condition.wait()
+                        continue
+                    when, _, name, token, stage = self._queue[0]
+                    job = self._jobs[name]
+                    if token != job.token:
+                        heapq.heappop(self._queue)  # replaced by read
+                        continue
+                    delay = when - time.monotonic()
+                    if delay > 0:
+                        self._condition.wait(delay)
+                        continue
+                    heapq.heappop(self._queue)
+                    break
+            # I2C is accessed out of the lock, only by this thread
+            if stage == self._TRIGGER:
+                self._trigger(job)
+            else:
+                self._collect(job)
+
+    def _trigger(self, job):
+        now = time.monotonic()
+        try:
+            ready_time = job.trigger() if job.trigger is not None else None
+        except (RuntimeError, pigpio.error):
+            self._finish(job, None, now)
+            return
+        with self._condition:
+            if job.next_time <= now < job.next_time + job.interval:
+                job.next_time += job.interval
+            else:
+                # first, early or late trigger
+                job.next_time = now + job.interval
+            job.measuring = True
+            job.retry = 0
+            self._push(now if ready_time is None else ready_time, job, self._COLLECT)
+
+    def _collect(self, job):
+        try:
+            value = job.collect()
+        except (RuntimeError, pigpio.error):
+            self._finish(job, None, time.monotonic())
+            return
+        if value is None and job.retry < self._RETRY_MAX:
+            with self._condition:
+                if job.retry == 0 and job.trigger is not None:
+                    job.late += 1
+                job.retry += 1
+                self._push(time.monotonic() + self._RETRY_INTERVAL, job, self._COLLECT)
+            return
+        self._finish(job, value, time.monotonic())
+
+    def _finish(self, job, value, now):
+        with self._condition:
+            if value is None:
+                job.missed += 1
+            else:
+                self._readings[job.name] = SensorReading(time.time(), value)
+            job.measuring = False
+            job.retry = 0
+            job.finished = time.time()
+            if job.next_time <= now:
+                # measurement took longer than the interval
+                job.next_time = now + job.interval
+            self._push(job.next_time, job, self._TRIGGER)
+            self._condition.notify_all()
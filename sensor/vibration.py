@@ -0,0 +1,83 @@
+import collections
+import numpy as np
+
+G_PER_COUNT = 1 / 16000  # left justified counts of Lis3dh at +-2 g in every power mode
+
+VibrationStats = collections.namedtuple('VibrationStats', ['timestamp', 'rms', 'peak_to_peak', 'band_energy'])
+
+
+def to_g(samples, g_per_count=G_PER_COUNT):
+    # x, y, z interleaved counts such as Lis3dhBuffer.read, or rows of them, to rows of g
+    return np.asarray(samples, dtype=np.float64).reshape(-1, 3) * g_per_count
+
+
+class VibrationAnalyzer:
+    # statistics of a window sliding by hop samples over a stream of acceleration,
+    # memory is bounded by the window and the samples of a feed
+
+    def __init__(self, rate, window=256, hop=64, bands=8, g_per_count=G_PER_COUNT):
+        if not 0 < hop <= window:
+            raise ValueError(f'Hop is not in 1 to window: {hop}')
+        self._rate = rate
+        self._window = window
+        self._hop = hop
+        self._g_per_count = g_per_count
+        frequencies = np.fft.rfftfreq(window, 1 / rate)
+        if isinstance(bands, int):
+            edges = np.linspace(0, rate / 2, bands + 1)
+            bands = list(zip(edges[:-1], edges[1:]))
+        self._bands = [(float(low), float(high)) for low, high in bands]
+        # bins of each band, upper edge is included in the last band only
+        self._band_masks = np.array([
+            (frequencies >= low) & ((frequencies < high) | ((high >= rate / 2) & (frequencies <= high)))
+            for low, high in self._bands], dtype=np.float64)
+        taper = np.hanning(window)
+        # one sided power spectrum scaled to sum up to the variance
+        scale = np.full(len(frequencies), 2 / (window * (taper ** 2).sum()))
+        scale[0] /= 2
+        if window % 2 == 0:
+            scale[-1] /= 2
+        self._taper = taper[:, np.newaxis]
+        self._scale = scale[:, np.newaxis]
+        self._history = np.zeros((0, 3))  # last samples not enough for the next window
+        self._history_timestamps = np.zeros(0)
+        self._next = window  # end of the next window in history, never less than window
+
+    @property
+    def bands(self):
+        return self._bands
+
+    def reset(self):
+        self._history = np.zeros((0, 3))
+        self._history_timestamps = np.zeros(0)
+        self._next = self._window
+
+    def feed(self, timestamps, samples):
+        # returns VibrationStats of the windows completed by samples
+        samples = to_g(samples, self._g_per_count)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(timestamps) != len(samples):
+            raise ValueError(f'Timestamps do not match samples: {len(timestamps)} != {len(samples)}')
+        data = np.concatenate([self._history, samples])
+        data_timestamps = np.concatenate([self._history_timestamps, timestamps])
+        ends = np.arange(self._next, len(data) + 1, self._hop)
+        results = []
+        if len(ends):
+            # windows of shape (count, window, 3) as a view without copying
+            windows = np.lib.stride_tricks.sliding_window_view(data, self._window, axis=0)
+            windows = windows[ends - self._window].transpose(0, 2, 1)
+            means = windows.mean(axis=1, keepdims=True)
+            centered = windows - means
+            rms = np.sqrt((centered ** 2).mean(axis=1))
+            peak_to_peak = windows.max(axis=1) - windows.min(axis=1)
+            power = np.abs(np.fft.rfft(centered * self._taper, axis=1)) ** 2 * self._scale
+            band_energy = np.einsum('bf,wfa->wba', self._band_masks, power)
+            for i, end in enumerate(ends):
+                results.append(VibrationStats(data_timestamps[end - 1], rms[i], peak_to_peak[i], band_energy[i]))
+            self._next = ends[-1] + self._hop
+        # keeps samples of the next window only
+        start = self._next - self._window
+        self._next -= start
+        self._history = data[start:].copy()
+        self._history_timestamps = data_timestamps[start:].copy()
+        return results